@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+"""
+Synthetic inputs for the benchmarks.
+
+Everything is generated from a fixed random seed so that runs on different
+commits work on the same data.
+"""
+
+from __future__ import absolute_import, print_function
+
+import os
+import random
+
+KEYWORD = "$$"
+COMMENT = "#"
+ACTIVE_COMMENT = "$"
+
+
+def axes(dims, values):
+    """Returns 'dims' list axes, named v0, v1, ..., with 'values' values each."""
+    return [
+        ("v%d" % axis, [axis * 1000 + i for i in range(values)]) for axis in range(dims)
+    ]
+
+
+def param_lines(axes):
+    """The axes as ParamParser commands, as pyslice builds them."""
+    return [
+        " ".join(["." + name] + [str(value) for value in values])
+        for name, values in axes
+    ]
+
+
+def template_tree(
+    path,
+    files=10,
+    lines=200,
+    keyword_lines=20,
+    active_blocks=2,
+    binaries=1,
+    binary_size=1 << 20,
+    dims=3,
+):
+    """Writes a template directory to 'path' that uses the variables of axes().
+
+    Each of the 'files' text files has 'lines' lines, 'keyword_lines' of
+    which have '$$...$$' expressions, and 'active_blocks' active comment
+    blocks of 5 lines.  The 'binaries' binary files have 'binary_size'
+    random bytes each.  Half of the files are put in a sub-directory.
+
+    """
+    rng = random.Random(0)
+    names = ["v%d" % axis for axis in range(dims)]
+    sub = os.path.join(path, "sub")
+    os.makedirs(sub)
+    for number in range(files):
+        directory = sub if number % 2 else path
+        out = []
+        every = max(lines // max(keyword_lines, 1), 1)
+        for line in range(lines):
+            if keyword_lines and line % every == 0 and line // every < keyword_lines:
+                name = names[line % len(names)]
+                out.append(
+                    "K%05d %s %s%s*2%s\n"
+                    % (line, KEYWORD + name + KEYWORD, KEYWORD, name, KEYWORD)
+                )
+            else:
+                out.append(
+                    "D%05d %s\n"
+                    % (line, " ".join("%10.4f" % rng.random() for _ in range(6)))
+                )
+        for _ in range(active_blocks):
+            out.append("%s%s {%s:>10}|5\n" % (COMMENT, ACTIVE_COMMENT, names[0]))
+            out.extend("%s\n" % ("*" * 40) for _ in range(5))
+        with open(os.path.join(directory, "input%03d.txt" % number), "w") as fpo:
+            fpo.write("".join(out))
+    for number in range(binaries):
+        directory = sub if number % 2 else path
+        with open(os.path.join(directory, "data%03d.bin" % number), "wb") as fpo:
+            fpo.write(bytes(rng.getrandbits(8) for _ in range(binary_size)))
+
+
+def config(path, template_path, output_path, axes, program="true", **flags):
+    """Writes a pyslice.ini for 'axes' to the directory 'path'."""
+    lines = [
+        "[paths]",
+        "template_path=%s" % template_path,
+        "output_path=%s" % output_path,
+        "",
+        "[flags]",
+        "keyword=%s" % KEYWORD,
+        "comment=%s" % COMMENT,
+        "active_comment=%s" % ACTIVE_COMMENT,
+        "keep_log=no",
+    ]
+    flags.setdefault("max_threads", 4)
+    flags.setdefault("flat_dirs", "yes")
+    for name, value in sorted(flags.items()):
+        lines.append("%s=%s" % (name, value))
+    lines.extend(["", "[program]", "program=%s" % program, ""])
+    for name, values in axes:
+        lines.extend(["[%s]" % name, "type=list", "values_list=%r" % list(values), ""])
+    with open(os.path.join(path, "pyslice.ini"), "w") as fpo:
+        fpo.write("\n".join(lines))
+
+
+def data_file(path, rows=10000, columns=5, repeats=1):
+    """Writes a whitespace separated table of numbers like model output.
+
+    The first column takes rows // repeats distinct values, so that
+    MeanCalculation has 'repeats' rows to average for each.
+
+    """
+    rng = random.Random(0)
+    with open(path, "w") as fpo:
+        for row in range(rows):
+            fpo.write(
+                "%d %s\n"
+                % (
+                    row % max(rows // repeats, 1),
+                    " ".join("%.6e" % rng.gauss(0, 1) for _ in range(columns - 1)),
+                )
+            )
@@ -0,0 +1,542 @@
+# -*- coding: utf-8 -*-
+"""
+NAME:
+    run_benchmarks.py
+
+SYNOPSIS:
+    python benchmarks/run_benchmarks.py [options] [benchmark ...]
+    python benchmarks/run_benchmarks.py --compare old.json new.json
+
+DESCRIPTION:
+    Times the hot paths of pyslice on synthetic inputs and writes the
+    results as JSON, by default to benchmarks/results/<date>-<commit>.json,
+    so that runs on different commits can be compared.  The pyslice in the
+    'src' directory next to this script is benchmarked, not an installed
+    one.  With no names all benchmarks are run.  The exit status is 1 if a
+    benchmark with a budget, like import_pyslice, went over it.
+
+OPTIONS:
+    -h,--help        this message
+    -l,--list        list the benchmarks
+    -q,--quick       smaller inputs and fewer repeats, for a smoke test
+    -r,--repeat N    number of timed repeats, default 5
+    -o,--output FILE where to write the JSON results
+    -c,--compare     compare two result files
+"""
+
+from __future__ import absolute_import, print_function
+
+import getopt
+import io
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(HERE), "src"))
+sys.path.insert(0, HERE)
+
+import generators  # noqa: E402
+
+# Sizes for the full and the --quick runs.
+SIZES = {
+    "full": {
+        "dims": 4,
+        "values": 10,
+        "files": 20,
+        "lines": 500,
+        "keyword_lines": 50,
+        "active_blocks": 4,
+        "binary_size": 4 << 20,
+        "permutations": 50,
+        "jobs": 200,
+        "rows": 100000,
+        "histogram": 200000,
+        "points": 20000,
+    },
+    "quick": {
+        "dims": 3,
+        "values": 5,
+        "files": 4,
+        "lines": 100,
+        "keyword_lines": 10,
+        "active_blocks": 1,
+        "binary_size": 64 << 10,
+        "permutations": 5,
+        "jobs": 20,
+        "rows": 2000,
+        "histogram": 5000,
+        "points": 500,
+    },
+}
+
+BENCHMARKS = []
+
+
+def benchmark(func):
+    """Registers func(size, tmp) as a benchmark.
+
+    It is called with the sizes and a scratch directory and returns
+    (timed, params): a function taking no arguments that does the work to
+    time, and the parameters to record with the timings.
+
+    """
+    BENCHMARKS.append(func)
+    return func
+
+
+@benchmark
+def enumerate_params(size, tmp):
+    """Plan enumeration and directory names, as Pyslice.run does it."""
+    import pyslice
+
+    template = os.path.join(tmp, "template")
+    os.mkdir(template)
+    axes = generators.axes(size["dims"], size["values"])
+    generators.config(tmp, template, os.path.join(tmp, "output"), axes, flat_dirs="no")
+
+    def timed():
+        plan = pyslice.Plan.from_ini(os.path.join(tmp, "pyslice.ini"))
+        return plan.directory_names()
+
+    return timed, {"dims": size["dims"], "values": size["values"]}
+
+
+# Modules 'import pyslice' must leave for first use: the post-processing
+# and plotting part of PySPG, and what it and the binary check pull in.
+IMPORT_DEFERRED = [
+    "binaryornot",
+    "numpy",
+    "past",
+    "pyslice.pyslice_lib.PySPG.Agrizer",
+    "pyslice.pyslice_lib.PySPG.Load",
+    "pyslice.pyslice_lib.PySPG.MatrixPlotter",
+    "pyslice.pyslice_lib.PySPG.MeanCalculation",
+    "pyslice.pyslice_lib.PySPG.MultiAgrizer",
+    "pyslice.pyslice_lib.PySPG.PyGrace",
+    "pyslice.pyslice_lib.PySPG.TeXParser",
+]
+
+# Seconds 'import pyslice' may take in a fresh interpreter.
+IMPORT_BUDGET = 0.1
+
+
+@benchmark
+def import_pyslice(size, tmp):
+    """'import pyslice' in a fresh interpreter, as every array task pays it.
+
+    Fails if any module in IMPORT_DEFERRED is imported, and the median is
+    checked against IMPORT_BUDGET.
+
+    """
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(
+        [os.path.join(os.path.dirname(HERE), "src"), env.get("PYTHONPATH", "")]
+    )
+    script = (
+        "import sys, time\n"
+        "start = time.perf_counter()\n"
+        "import pyslice\n"
+        "elapsed = time.perf_counter() - start\n"
+        "print(elapsed)\n"
+        "print(' '.join(i for i in %r if i in sys.modules))\n" % IMPORT_DEFERRED
+    )
+
+    def timed():
+        out = subprocess.check_output([sys.executable, "-c", script], cwd=tmp, env=env)
+        elapsed, _, imported = out.decode().partition("\n")
+        if imported.strip():
+            raise RuntimeError("'import pyslice' imported %s" % imported.strip())
+        return float(elapsed)
+
+    return timed, {"measures": "import time", "budget": IMPORT_BUDGET}
+
+
+def _pyslice_run(path, *options):
+    """Runs pyslice in 'path' with 'options', answering yes."""
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(
+        [os.path.join(os.path.dirname(HERE), "src"), env.get("PYTHONPATH", "")]
+    )
+    return subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            "import sys; sys.argv = ['pyslice'] + %r + ['y']; import pyslice; "
+            "pyslice.main()" % list(options),
+        ],
+        cwd=path,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        check=True,
+    )
+
+
+@benchmark
+def render(size, tmp):
+    """Rendering the template tree for a number of permutations.
+
+    Runs pyslice with '--profile' and a no-op program and takes the time of
+    the 'render' phase from its profile.
+
+    """
+    template = os.path.join(tmp, "template")
+    generators.template_tree(
+        template,
+        files=size["files"],
+        lines=size["lines"],
+        keyword_lines=size["keyword_lines"],
+        active_blocks=size["active_blocks"],
+        binary_size=size["binary_size"],
+        dims=2,
+    )
+    values = size["permutations"]
+    axes = [("v0", list(range(values))), ("v1", [1])]
+    output = os.path.join(tmp, "output")
+    generators.config(tmp, template, output, axes, max_threads=1)
+
+    def timed():
+        if os.path.isdir(output):
+            shutil.rmtree(output)
+        _pyslice_run(tmp, "--profile")
+        with open(os.path.join(output, "pyslice_profile.txt")) as fpi:
+            for line in fpi:
+                words = line.split()
+                if words and words[0] == "render":
+                    return float(words[2])
+        raise RuntimeError("no 'render' phase in the profile")
+
+    return timed, {
+        "permutations": values,
+        "files": size["files"],
+        "lines": size["lines"],
+        "keyword_lines": size["keyword_lines"],
+        "active_blocks": size["active_blocks"],
+        "binary_size": size["binary_size"],
+        # The benchmark reports the phase time, not its own wall time.
+        "measures": "render phase",
+    }
+
+
+@benchmark
+def plan_render(size, tmp):
+    """Plan.render of every permutation from a plan kept in memory."""
+    import pyslice
+
+    template = os.path.join(tmp, "template")
+    generators.template_tree(
+        template,
+        files=size["files"],
+        lines=size["lines"],
+        keyword_lines=size["keyword_lines"],
+        active_blocks=size["active_blocks"],
+        binary_size=size["binary_size"],
+        dims=2,
+    )
+    values = size["permutations"]
+    axes = [("v0", list(range(values))), ("v1", [1])]
+    output = os.path.join(tmp, "output")
+    generators.config(tmp, template, output, axes)
+    plan = pyslice.Plan.from_ini(os.path.join(tmp, "pyslice.ini"))
+
+    def timed():
+        if os.path.isdir(output):
+            shutil.rmtree(output)
+        for perm_id, _ in plan.iter_permutations():
+            plan.render(perm_id)
+
+    return timed, {
+        "permutations": values,
+        "files": size["files"],
+        "lines": size["lines"],
+        "keyword_lines": size["keyword_lines"],
+        "active_blocks": size["active_blocks"],
+        "binary_size": size["binary_size"],
+    }
+
+
+@benchmark
+def sweep(size, tmp):
+    """A whole pyslice run of no-op jobs, from reading pyslice.ini to the end."""
+    template = os.path.join(tmp, "template")
+    generators.template_tree(template, files=1, lines=10, binaries=0, dims=1)
+    axes = [("v0", list(range(size["jobs"])))]
+    output = os.path.join(tmp, "output")
+    generators.config(tmp, template, output, axes)
+
+    def timed():
+        if os.path.isdir(output):
+            shutil.rmtree(output)
+        _pyslice_run(tmp)
+
+    return timed, {"jobs": size["jobs"]}
+
+
+def _launch_benchmark(name, limits=False):
+    def launch(size, tmp):
+        from pyslice.pyslice_lib import launcher
+
+        jobs = size["jobs"]
+        setup = None
+        if limits:
+            # Limits need a hook in the new process, which keeps Popen
+            # from using vfork.
+            setup = launcher.ChildSetup([("limit_open_files", 256)])
+
+        def timed():
+            runner = launcher.make_launcher(name)
+            try:
+                for _ in range(jobs):
+                    runner.wait(runner.launch(["true"], tmp, None, setup))
+            finally:
+                runner.close()
+
+        return timed, {"jobs": jobs, "limits": limits}
+
+    launch.__name__ = "launch_" + name + ("_limits" if limits else "")
+    launch.__doc__ = "Start and wait for no-op processes with the %s launcher%s." % (
+        name,
+        ", with resource limits" if limits else "",
+    )
+    return launch
+
+
+if os.name != "nt":
+    for _limits in [False, True]:
+        for _name in ["popen", "posix_spawn", "forkserver"]:
+            benchmark(_launch_benchmark(_name, _limits))
+
+
+@benchmark
+def load_data(size, tmp):
+    """Load.loadData of a model output table."""
+    from pyslice.pyslice_lib.PySPG.Load import loadData
+
+    path = os.path.join(tmp, "out.dat")
+    generators.data_file(path, rows=size["rows"])
+
+    def timed():
+        return loadData(path)
+
+    return timed, {"rows": size["rows"], "columns": 5}
+
+
+@benchmark
+def mean_calculation(size, tmp):
+    """MeanCalculation.mean over the directories of a small sweep."""
+    from pyslice.pyslice_lib.PySPG.MeanCalculation import MeanCalculation
+
+    lines = generators.param_lines(generators.axes(2, 4))
+    parser = MeanCalculation(lines)
+    rows = size["rows"] // 10
+    for _ in parser.pp_varying:
+        directory = os.path.join(tmp, parser.pp_varying.directory_tree())
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+            generators.data_file(
+                os.path.join(directory, "out.dat"), rows=rows, repeats=10
+            )
+
+    def timed():
+        cwd = os.getcwd()
+        os.chdir(tmp)
+        try:
+            parser.doit("out.dat", "mean.dat")
+        finally:
+            os.chdir(cwd)
+
+    return timed, {"permutations": 16, "rows": rows, "repeats": 10}
+
+
+@benchmark
+def spg_histogram(size, tmp):
+    """SPGHistogram.add_value and get_dataset."""
+    import random
+
+    from pyslice.pyslice_lib.PySPG.histogram import SPGHistogram
+
+    rng = random.Random(0)
+    values = [rng.gauss(0.1, 0.5) for _ in range(size["histogram"])]
+
+    def timed():
+        hist = SPGHistogram(0.01)
+        for value in values:
+            hist.add_value(value)
+        return hist.get_dataset()
+
+    return timed, {"values": size["histogram"], "boxsize": 0.01}
+
+
+@benchmark
+def grace_dump(size, tmp):
+    """PyGrace GraceDocument autoscale and dump of four data sets."""
+    import math
+
+    from pyslice.pyslice_lib.PySPG.PyGrace import GraceDocument
+
+    points = size["points"]
+    datasets = [
+        [[i * 0.01, math.sin(i * 0.01 * (k + 1))] for i in range(points)]
+        for k in range(4)
+    ]
+
+    def timed():
+        doc = GraceDocument()
+        for number, data in enumerate(datasets):
+            doc.set_data(data, "set %d" % number)
+        doc.autoscale()
+        out = io.StringIO()
+        doc.dump(out)
+        return out.getvalue()
+
+    return timed, {"datasets": 4, "points": points}
+
+
+def git_commit():
+    try:
+        return (
+            subprocess.check_output(
+                ["git", "rev-parse", "--short", "HEAD"],
+                cwd=HERE,
+                stderr=subprocess.DEVNULL,
+            )
+            .decode()
+            .strip()
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def run(names, quick=False, repeat=5):
+    """Runs the benchmarks 'names' and returns the results."""
+    size = SIZES["quick" if quick else "full"]
+    results = {
+        "commit": git_commit(),
+        "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "sizes": "quick" if quick else "full",
+        "benchmarks": {},
+        "over_budget": [],
+    }
+    for func in BENCHMARKS:
+        if names and func.__name__ not in names:
+            continue
+        tmp = tempfile.mkdtemp(prefix="pyslice-bench-")
+        try:
+            timed, params = func(size, tmp)
+            # One untimed run to warm caches and imports.
+            timed()
+            times = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                value = timed()
+                elapsed = time.perf_counter() - start
+                if params.get("measures"):
+                    elapsed = value
+                times.append(elapsed)
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+        times.sort()
+        median = times[len(times) // 2]
+        results["benchmarks"][func.__name__] = {
+            "params": params,
+            "times": times,
+            "min": times[0],
+            "median": median,
+            "mean": sum(times) / len(times),
+        }
+        over = ""
+        if params.get("budget") is not None and median > params["budget"]:
+            results["over_budget"].append(func.__name__)
+            over = "  over budget of %.4f s" % params["budget"]
+        print(
+            "%-24s median %10.4f s  min %10.4f s%s"
+            % (func.__name__, median, times[0], over)
+        )
+    return results
+
+
+def compare(old_path, new_path):
+    """Prints the median of each benchmark in two result files."""
+    with open(old_path) as fpi:
+        old = json.load(fpi)
+    with open(new_path) as fpi:
+        new = json.load(fpi)
+    print("%-24s%14s%14s%10s" % ("benchmark", old["commit"], new["commit"], "new/old"))
+    for name in sorted(set(old["benchmarks"]) | set(new["benchmarks"])):
+        before = old["benchmarks"].get(name, {}).get("median")
+        after = new["benchmarks"].get(name, {}).get("median")
+        ratio = ""
+        if before and after:
+            ratio = "%.2f" % (after / before)
+        print(
+            "%-24s%14s%14s%10s"
+            % (
+                name,
+                "-" if before is None else "%.4f" % before,
+                "-" if after is None else "%.4f" % after,
+                ratio,
+            )
+        )
+
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv
+    opts, args = getopt.getopt(
+        argv[1:],
+        "hlqr:o:c",
+        ["help", "list", "quick", "repeat=", "output=", "compare"],
+    )
+    quick = False
+    repeat = 5
+    output = None
+    for opt, value in opts:
+        if opt in ["-h", "--help"]:
+            print(__doc__)
+            return 0
+        if opt in ["-l", "--list"]:
+            for func in BENCHMARKS:
+                print("%-24s %s" % (func.__name__, func.__doc__.splitlines()[0]))
+            return 0
+        if opt in ["-c", "--compare"]:
+            compare(*args)
+            return 0
+        if opt in ["-q", "--quick"]:
+            quick = True
+            repeat = 2
+        elif opt in ["-r", "--repeat"]:
+            repeat = int(value)
+        elif opt in ["-o", "--output"]:
+            output = value
+    unknown = set(args) - set(func.__name__ for func in BENCHMARKS)
+    if unknown:
+        print("Unknown benchmarks: %s" % ", ".join(sorted(unknown)))
+        return 2
+    results = run(args, quick=quick, repeat=repeat)
+    if output is None:
+        output = os.path.join(
+            HERE,
+            "results",
+            "%s-%s.json" % (time.strftime("%Y%m%d-%H%M%S"), results["commit"]),
+        )
+    if os.path.dirname(output) and not os.path.isdir(os.path.dirname(output)):
+        os.makedirs(os.path.dirname(output))
+    with open(output, "w") as fpo:
+        json.dump(results, fpo, indent=2)
+    print("Results written to %s" % output)
+    if results["over_budget"]:
+        print("Over budget: %s" % ", ".join(results["over_budget"]))
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -16,12 +16,18 @@ OPTIONS:
     -h,--help        this message
     -v,--version     version
     -d,--debug       turn on debug messages
+    -p,--profile     time each phase of the run, written to
+                     output_path/pyslice_profile.txt
+    --profile-cpu    also run cProfile over the main thread
+    --profile-memory also trace memory allocations
 
 EXAMPLES:
     1. As standalone
         pyslice.py
     2. As library
         import pyslice
+        plan = pyslice.Plan.from_ini("pyslice.ini")
+        plan.render(0, "/tmp/first")
         ...
 """
 
@@ -52,23 +58,21 @@ EXAMPLES:
 
 from __future__ import absolute_import, print_function
 
-import filecmp
+import contextlib
+import functools
 import getopt
+import hashlib
 import math
 import os
 import os.path
 import random
-import re
 import shlex
-import shutil
 import subprocess
 
 # ===imports======================
 import sys
 import time
 
-from binaryornot.check import is_binary
-
 try:
     import threading as _threading
 except ImportError:
@@ -77,11 +81,26 @@ except ImportError:
 import configparser as configparser
 
 from pyslice.pyslice_lib import PySPG as pyspg
+from pyslice.pyslice_lib import (
+    batch,
+    joblog,
+    launcher,
+    links,
+    outputs,
+    phases,
+    plancache,
+    preview,
+    progress,
+    pymodel,
+    scheduler,
+    template,
+    trace,
+    writer,
+)
 
 # ===globals======================
 modname = "pyslice"
 __version__ = "1.6.5"
-LINEENDS = "\r\n"
 
 
 # --option args--
@@ -95,8 +114,6 @@ input_file = "pyslice.ini"
 # Didn't want to have an infinite amount of jobs.
 # This is just for if user makes max_threads <= 0.
 total_processes = 64
-numargs = 2
-speciallines = {}
 
 # ===utilities====================
 
@@ -129,301 +146,151 @@ def assignment(var1, var2):
         return var2
 
 
-# User-defined Exceptions
-
-
-class NumberConfigSectionsError(Exception):
-    pass
-
-
-class ConfigFileNotFoundError(Exception):
-    pass
+def dequote(in_str):
+    """Removes quotes around strings in the configuration file.
+    This corrects a mistake that I would commonly make.
 
-
-class RequiredSectionNotFoundError(Exception):
-    pass
+    """
+    in_str = in_str.replace("'", "")
+    in_str = in_str.replace('"', "")
+    return in_str
 
 
-class NotValidTypeError(Exception):
-    pass
+def path_correction(path):
+    """Corrects path separators and removes trailing path separators.
 
+    Needed so that path separators of any OS are corrected to the
+    platform running the script.
 
-class TemplatePathNotFoundError(Exception):
-    pass
+    """
+    path = path.replace("/", os.sep)
+    path = path.replace("\\", os.sep)
+    if path[-1] == "/" or path[-1] == "\\":
+        path = path[:-1]
+    return path
 
 
-# ====================================
+def to_number(value):
+    """Returns value as an int, or a float, or as it is if it's neither."""
+    try:
+        return int(value)
+    except ValueError:
+        try:
+            return float(value)
+        except ValueError:
+            return value
 
 
-class Pyslice(object):
-    # ---class variables---
-    # --------------------------
+def run_program(program, directory, keep_log=True):
+    """Runs program in directory and returns its exit status.
 
-    def __init__(self):
-        # ---instance variables---
-        pass
+    Standard output and error are written to 'pyslice.log' in the directory
+    when keep_log is set.
 
-    # --------------------------
-    def read_config(self, min_sections, max_sections, req_sections_list):
-        """Reads the pyslice.ini file."""
+    """
+    runner = launcher.PopenLauncher()
+    log_path = None
+    if keep_log:
+        log_path = os.path.join(directory, "pyslice.log")
+    # PYSLICE can be used in subprocess to do different things if
+    # script is run outside of Pyslice.
+    setup = launcher.ChildSetup(environ={"PYSLICE": "1"})
+    returncode, _ = runner.wait(
+        runner.launch(shlex.split(program), directory, log_path, setup)
+    )
+    return returncode
 
-        # Can we find pyslice.ini?
-        pyslice_ini = os.path.join(os.getcwd(), input_file)
-        if not os.access(pyslice_ini, os.F_OK | os.R_OK):
-            raise ConfigFileNotFoundError(
-                "{} was not found or not readable ***".format(input_file)
-            )
-        # Read it in.
-        config_dict = configparser.ConfigParser()
-        config_dict.read(pyslice_ini)
 
-        # Is pyslice.ini minimally error free?
-        num_sections = len(config_dict.sections())
-        if num_sections < min_sections or num_sections > max_sections:
-            raise NumberConfigSectionsError(
-                "pyslice.ini must have between %d and %d sections."
-                % (min_sections, max_sections)
-            )
-        for sec in req_sections_list:
-            if not config_dict.has_section(sec):
-                raise RequiredSectionNotFoundError(
-                    "pyslice.ini requires the [%s] section." % sec
-                )
+# User-defined Exceptions
 
-        # Return pyslice.ini as dictionary.
-        return config_dict
 
-    def dequote(self, in_str):
-        """Removes quotes around strings in the configuration file.
-        This corrects a mistake that I would commonly make.
+class NumberConfigSectionsError(Exception):
+    pass
 
-        """
-        in_str = in_str.replace("'", "")
-        in_str = in_str.replace('"', "")
-        return in_str
 
-    def path_correction(self, path):
-        """Corrects path separators and removes trailing path separators.
+class ConfigFileNotFoundError(Exception):
+    pass
 
-        Needed so that path separators of any OS are corrected to the
-        platform running the script.
 
-        """
-        path = path.replace("/", os.sep)
-        path = path.replace("\\", os.sep)
-        if path[-1] == "/" or path[-1] == "\\":
-            path = path[:-1]
-        return path
-
-    def create_output(self, var_set, dirname, dirs, fnames):
-        var_dict = {}
-        for variables in var_set[1:]:
-            exec("{} = {}".format(variables[0], variables[1]))
-            var_dict[variables[0]] = variables[1]
+class RequiredSectionNotFoundError(Exception):
+    pass
 
-        try:
-            os.makedirs(os.path.join(_output_path, _strtag))
-        except OSError:
-            pass
-        for dirn in dirs:
-            infilepath = os.path.join(dirname, dirn)
-            rel_dir = infilepath.replace(_template_path + os.sep, "")
-            try:
-                os.makedirs(os.path.join(_output_path, _strtag, rel_dir))
-            except OSError:
-                pass
-        for files in fnames:
-            excludeflag = False
-            for extensions in _exclude_list:
-                if extensions in files:
-                    excludeflag = True
-            if excludeflag:
-                continue
-            infilepath = os.path.join(dirname, files)
-            rel_dir = infilepath.replace(_template_path + os.sep, "")
-            outfilepath = os.path.join(_output_path, _strtag, rel_dir)
-
-            # Is this a text file?  If so, just open as a template
-            if not is_binary(infilepath):
-                with open(infilepath, "r") as inputf:
-                    with open(outfilepath, "w") as output:
-                        shutil.copystat(infilepath, outfilepath)
-
-                        filetotalizer = []
-                        # Search for _keywordvarname_keyword and replace with
-                        # appropriate value.
-                        escaped_keyword = re.escape(_keyword)
-                        keyword_search = re.compile(escaped_keyword)
-                        search_for = re.compile(
-                            escaped_keyword + "(.*?)" + escaped_keyword
-                        )
-
-                        for lineraw in inputf:
-                            line = lineraw
-                            # Active comments first...
-                            if CODE == line[: len(CODE)]:
-                                filetotalizer.append(line)
-                                words = line.split("|")
-                                # There is the possibility that a datafile
-                                # would WANT to use | So fix words up to have
-                                # 1 or two items...
-
-                                # if block length is missing... too cold
-                                if len(words) == 1:
-                                    linetemplate = words[0]
-                                    blocklen = 1
-
-                                # if template includes | ... too hot
-                                # right now MUST include block length
-                                if len(words) > numargs:
-                                    linetemplate = words[:-2].join("|")
-                                    blocklen = int(words[-1])
-
-                                # ... just right
-                                if len(words) == 2:
-                                    linetemplate = words[0]
-                                    blocklen = int(words[1])
-
-                                linetemplate = linetemplate[len(CODE) :]
-
-                                # Process special directives
-                                if "~" == linetemplate[1]:
-                                    # Only want to open file once by checking
-                                    # dictionary
-                                    lookupno, filename = words[0].split()[1:3]
-                                    lookupno = lookupno.split("~")[1]
-                                    try:
-                                        speciallines[filename]
-                                    except KeyError:
-                                        speciallines.setdefault(filename, {})
-                                        with open(filename, "r") as lout:
-                                            for line in lout:
-                                                # Handle comments and blank lines
-                                                if "#" == line[0]:
-                                                    continue
-                                                (
-                                                    recno,
-                                                    sep,
-                                                    stemplate,
-                                                ) = line.partition("|")
-                                                if not stemplate:
-                                                    continue
-                                                stemplate = stemplate.rstrip(LINEENDS)
-                                                speciallines[filename][
-                                                    recno
-                                                ] = stemplate
-                                    line_sub = speciallines[filename][lookupno].format(
-                                        **var_dict
-                                    )
-
-                                else:
-                                    line_sub = linetemplate.format(**var_dict)
-
-                                for blockline in range(blocklen):
-                                    linein = next(inputf)
-                                    nline = []
-                                    for index, char in enumerate(line_sub):
-                                        if char == "*":
-                                            nline.append(linein[index])
-                                        else:
-                                            nline.append(line_sub[index])
-                                    filetotalizer.append("".join(nline))
-                            elif keyword_search.search(line):
-                                matchline = line
-                                for matches in search_for.findall(matchline):
-                                    for var_name in var_dict:
-                                        if var_name in matches:
-                                            # replace variable name with number
-                                            match = matches.replace(
-                                                var_name, str(var_dict[var_name])
-                                            )
-                                            # evaluate Python statement with
-                                            # eval
-                                            match = eval(match)
-                                            # replace variable with calculated
-                                            # value
-                                            matchwhat = re.escape(
-                                                _keyword + matches + _keyword
-                                            )
-                                            matchline = re.sub(
-                                                matchwhat,
-                                                str(match),
-                                                matchline,
-                                                count=1,
-                                            )
-                                filetotalizer.append(matchline)
-                            else:
-                                filetotalizer.append(line)
-                        output.write("".join(filetotalizer))
-            else:
-                try:
-                    if filecmp.cmp(infilepath, outfilepath) is False:
-                        shutil.copy(infilepath, outfilepath)
-                except OSError:
-                    shutil.copy(infilepath, outfilepath)
-                continue
 
-    # Runs the command *com in a new thread.
-    def start_thread_process(self, *com):
-        com = " ".join(com)
-        com = shlex.split(com)
-        # PYSLICE can be used in subprocess to do different things if script
-        # is run outside of Pyslice.
-        os.environ["PYSLICE"] = "1"
-        if os.name != "nt":
-            p = subprocess.Popen(
-                com,
-                stdin=subprocess.PIPE,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.STDOUT,
-                close_fds=True,
-            )
-        else:
-            # close_fds is not supported on Windows
-            p = subprocess.Popen(
-                com,
-                stdin=subprocess.PIPE,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.STDOUT,
-            )
+class NotValidTypeError(Exception):
+    pass
 
-        chstdouterr = p.communicate()[0]
 
-        if _keep_log is True:
-            with open("pyslice.log", "w") as fo:
-                fo.write(str(chstdouterr))
+class TemplatePathNotFoundError(Exception):
+    pass
 
-    def run(self):
-        global _strtag
-        global _output_path
-        global _keyword
-        global _template_path
-        global _exclude_list
-        global _keep_log
-        global CODE
 
-        ftn = "Pyslice.run"
-        debug(ftn, "hello, world")
+class RequiredOptionNotFoundError(Exception):
+    pass
 
-        if len(sys.argv) == 1:
 
-            toss = """
-            Pyslice will replace all files in the output directories
-            with the same name as files in the template directory.  If
-            this is not what you want, move the files as necessary.  Pyslice
-            also does not check if the permutation schedule is the same and
-            may not use the same number of output directories from previous
-            pyslice runs.
+def check_config(config_dict, min_sections, max_sections, req_sections_list):
+    """Is pyslice.ini minimally error free?"""
+    num_sections = len(config_dict.sections())
+    if num_sections < min_sections or num_sections > max_sections:
+        raise NumberConfigSectionsError(
+            "pyslice.ini must have between %d and %d sections."
+            % (min_sections, max_sections)
+        )
+    for sec in req_sections_list:
+        if not config_dict.has_section(sec):
+            raise RequiredSectionNotFoundError(
+                "pyslice.ini requires the [%s] section." % sec
+            )
 
-            'Press "Enter" to continue . . .' """
-            _ = input(toss)
 
-        # Read the configuration file and set appropriate variables.
-        configuration = self.read_config(4, 100, ["paths", "flags", "program"])
-        _template_path = self.dequote(configuration.get("paths", "template_path"))
-        _output_path = self.dequote(configuration.get("paths", "output_path"))
-        _keyword = self.dequote(configuration.get("flags", "keyword"))
-        max_threads = configuration.getint("flags", "max_threads")
+class Plan(object):
+    """A sweep worked out once, to render any number of times.
+
+    The variables and the template directory of a pyslice.ini, or of a
+    dictionary with the same sections, are read when the plan is made.  Any
+    permutation can then be rendered into any directory, without globals or
+    questions, so a program can keep a plan and render from it as needed::
+
+        plan = pyslice.Plan.from_ini("pyslice.ini")
+        for perm_id, variables in plan.iter_permutations():
+            plan.render(perm_id, os.path.join("/scratch", str(perm_id)))
+
+    Relative paths, including the template strings files of active
+    comments, are taken from 'base_path'.  With a 'cache_key' the plan is
+    kept in output_path with plancache between runs.  'profile' is the
+    phases.Phases to mark the compile, enumerate, substitute and copy
+    phases in.  With 'incremental' what is rendered is recorded with
+    outputs.RenderManifest, and files that would come out the same as
+    before are not rendered again.  Binary files are put in place by
+    'linker', a links.Linker with the 'link_binaries' rules, and rendered
+    text is written by 'writer', a writer.WriteBehind, unless write_buffer
+    is 0 or the files are rendered by more than one of 'render_threads',
+    which then write them.  Call close() to stop their threads.
+
+    """
+
+    def __init__(
+        self,
+        configuration,
+        base_path=None,
+        cache_key=None,
+        profile=None,
+        incremental=False,
+    ):
+        check_config(configuration, 4, 100, ["paths", "flags", "program"])
+        if profile is None:
+            profile = phases.Phases()
+        self.phases = profile
+        self.base_path = os.path.abspath(base_path or os.getcwd())
+        self.template_path = self.path(
+            dequote(configuration.get("paths", "template_path"))
+        )
+        self.output_path = self.path(dequote(configuration.get("paths", "output_path")))
+        if not os.path.exists(self.template_path):
+            raise TemplatePathNotFoundError(
+                "The template path doesn't exists at '%s'" % (self.template_path)
+            )
+        self.keyword = dequote(configuration.get("flags", "keyword"))
         try:
             COMMENT_CODE = configuration.get("flags", "comment")
         except:
@@ -432,19 +299,47 @@ class Pyslice(object):
             DT_CODE = assignment(configuration.get("flags", "active_comment"), "")
         except:
             DT_CODE = "qwerty"
-        CODE = COMMENT_CODE + DT_CODE
-        _exclude_list = []
+        self.code = COMMENT_CODE + DT_CODE
+        self.exclude_list = []
         if configuration.has_option("flags", "exclude_copy"):
-            _exclude_list = eval(configuration.get("flags", "exclude_copy"))
-        if max_threads <= 0:
-            max_threads = total_processes
-        flat_dirs = configuration.getboolean("flags", "flat_dirs")
+            self.exclude_list = eval(configuration.get("flags", "exclude_copy"))
+        # How binary template files are put in the output directories
+        link_rules = []
+        if configuration.has_option("flags", "link_binaries"):
+            link_rules = links.parse_rules(configuration.get("flags", "link_binaries"))
+            for _, strategy in link_rules:
+                if strategy not in links.STRATEGIES:
+                    raise NotValidTypeError(
+                        "'%s' is not a valid link strategy - %s"
+                        % (strategy, links.STRATEGIES)
+                    )
+        self.linker = links.Linker(link_rules)
+        self.flat_dirs = configuration.getboolean("flags", "flat_dirs")
         try:
-            _keep_log = configuration.getboolean("flags", "keep_log")
+            self.keep_log = configuration.getboolean("flags", "keep_log")
         except:
-            _keep_log = True
-
-        program = self.dequote(configuration.get("program", "program"))
+            self.keep_log = True
+        # Threads to render the files of a permutation with
+        self.render_threads = 1
+        if configuration.has_option("flags", "render_threads"):
+            self.render_threads = configuration.getint("flags", "render_threads")
+        self._io_pool = None
+        # Megabytes of rendered text to write behind the rendering, 0 to
+        # write every file before rendering the next.
+        self.write_buffer = 16.0
+        if configuration.has_option("flags", "write_buffer"):
+            self.write_buffer = configuration.getfloat("flags", "write_buffer")
+        # Render threads write their own files, in parallel, instead of
+        # queueing them all for the one writer thread.
+        self.writer = None
+        if self.write_buffer > 0 and self.render_threads == 1:
+            self.writer = writer.WriteBehind(int(self.write_buffer * 1048576))
+        self.model_callable = None
+        self.program = None
+        if configuration.has_option("program", "callable"):
+            self.model_callable = dequote(configuration.get("program", "callable"))
+        else:
+            self.program = dequote(configuration.get("program", "program"))
 
         # Remove the standard configuration sections to leave all of the
         # variables.
@@ -452,16 +347,83 @@ class Pyslice(object):
         del section_list[section_list.index("paths")]
         del section_list[section_list.index("flags")]
         del section_list[section_list.index("program")]
+        # Variables drawn at random, which flat directories number by sample
+        self.samples = [
+            name
+            for name in section_list
+            if configuration.get(name, "type") == "montecarlo"
+        ]
+
+        # The plan cache saves working out the variables and permutations
+        # and compiling the templates again when none of them changed.
+        self.cache_key = cache_key
+        self.cache_path = os.path.join(self.output_path, plancache.CACHE_FILE)
+        cached = None
+        if cache_key is not None:
+            cached = plancache.load(self.cache_path, cache_key)
+        if cached is None:
+            self.axes = self.parse_variables(configuration, section_list)
+            self._manifest = None
+            self._permutations = None
+        else:
+            self.axes = cached["axes"]
+            self._manifest = cached["manifest"]
+            self._permutations = cached["permutations"]
+
+        self.rendered = None
+        if incremental:
+            self.rendered = outputs.RenderManifest.load(
+                os.path.join(self.output_path, outputs.MANIFEST_FILE)
+            )
+        self._names = None
+        # Directories above the permutation directories known to exist
+        self._parents = set()
 
-        # Make sure to clean up the paths.
-        _template_path = os.path.abspath(self.path_correction(_template_path))
-        _output_path = os.path.abspath(self.path_correction(_output_path))
-
-        if not os.path.exists(_template_path):
-            raise TemplatePathNotFoundError(
-                "The template path doesn't exists at '%s'" % (_template_path)
+        # This does the cartesian of all of the parameter values.
+        self.parser = pyspg.ParamParser(self.axes)
+        # Size up the sweep from the number of values of each variable,
+        # before anything is enumerated.
+        self.sizes = preview.axis_sizes(self.parser)
+
+    @classmethod
+    def from_ini(cls, ini_path, cache=False, profile=None, incremental=False):
+        """Makes the plan of an ini file, kept in output_path if 'cache'."""
+        if not os.access(ini_path, os.F_OK | os.R_OK):
+            raise ConfigFileNotFoundError(
+                "{} was not found or not readable ***".format(ini_path)
             )
+        configuration = configparser.ConfigParser()
+        configuration.read(ini_path)
+        cache_key = None
+        if cache:
+            cache_key = plancache.make_key(ini_path, __version__)
+        return cls(
+            configuration,
+            os.path.dirname(os.path.abspath(ini_path)),
+            cache_key,
+            profile,
+            incremental,
+        )
+
+    @classmethod
+    def from_dict(cls, config, base_path=None, profile=None, incremental=False):
+        """Makes the plan of a dictionary of sections of options.
+
+        The values are written as they would be in pyslice.ini, but can be
+        Python objects where their repr() reads the same, for example
+        {"flow": {"type": "list", "values_list": [90, 92]}}.
+
+        """
+        configuration = configparser.ConfigParser()
+        configuration.read_dict(config)
+        return cls(configuration, base_path, None, profile, incremental)
+
+    def path(self, path):
+        """Returns the absolute path of a path relative to base_path."""
+        return os.path.join(self.base_path, path_correction(path))
 
+    def parse_variables(self, configuration, section_list):
+        """Returns the PySPG commands for the variable sections."""
         # Put all variable names from configuration file into key_list.
         # Create list (from each variable) of lists (from start, stop, incr).
         list_list = []
@@ -512,10 +474,44 @@ class Pyslice(object):
             list_list.append(var_list)
 
         list_list = [" ".join(i) for i in list_list]
+        return list_list
+
+    def __len__(self):
+        return preview.count(self.sizes)
+
+    @property
+    def manifest(self):
+        """The compiled template directory, compiled on first use."""
+        if self._manifest is None:
+            with self.phases.phase("compile"):
+                self._manifest = template.build_manifest(
+                    self.template_path,
+                    self.exclude_list,
+                    self.code,
+                    self.keyword,
+                    [name for name, _ in self.sizes],
+                    self.base_path,
+                )
+            if self._permutations is not None:
+                self.save()
+        return self._manifest
 
-        # This does the cartesian of all of the parameter values.
-        pyspg_obj = pyspg.ParamParser(list_list)
+    @property
+    def permutations(self):
+        """Every permutation as ['directory', [var, value], ...]."""
+        if self._permutations is None:
+            with self.phases.phase("enumerate"):
+                self._permutations = self.enumerate_permutations()
+            self.save()
+        return self._permutations[0]
 
+    def enumerate_permutations(self):
+        """Returns every permutation and what's needed to name their directories.
+
+        Returns nset, the largest value of each integer variable, and the
+        variables that are not all integers.
+
+        """
         # nset will contain ['directory', [var, var_value], [var1, var1_value],
         # ...]
         nset = []
@@ -524,28 +520,817 @@ class Pyslice(object):
 
         nmax = {}
         allints = {}
-        for _ in pyspg_obj:
+        for _ in self.parser:
             tmp = []
             # Had to add the 'limit=None' in order to get directories created
             # for the last variable.  Is this a bug in PySPG?
-            tmp.append(pyspg_obj.directory_tree(limit=None))
+            tmp.append(self.parser.directory_tree(limit=None))
 
-            for i_iter in pyspg_obj.variables_list:
+            for i_iter in self.parser.variables_list:
                 vname = i_iter.get_varname()
-                nval = pyspg_obj.actual_values[vname]
-                try:
-                    nval = int(nval)
-                except ValueError:
+                nval = to_number(self.parser.actual_values[vname])
+                if not isinstance(nval, int):
                     allints[vname] = False
-                    try:
-                        nval = float(nval)
-                    except ValueError:
-                        pass
-                if isinstance(nval, int):
-                    if nmax.setdefault(vname, float("-inf")) < nval:
-                        nmax[vname] = nval
+                elif nmax.setdefault(vname, float("-inf")) < nval:
+                    nmax[vname] = nval
                 tmp.append([vname, nval])
             nset.append(tmp)
+        return nset, nmax, allints
+
+    def save(self):
+        """Keeps the plan in output_path, if it was made with a cache_key."""
+        if self.cache_key is None:
+            return
+        os.makedirs(self.output_path, exist_ok=True)
+        sources = []
+        dirs = []
+        if self._manifest is not None:
+            sources = self._manifest.sources
+            dirs = self._manifest.dirs
+        plancache.save(
+            self.cache_path,
+            self.cache_key,
+            {
+                "axes": self.axes,
+                "manifest": self._manifest,
+                "permutations": self._permutations,
+            },
+            sources,
+            dirs,
+        )
+
+    def axis_values(self):
+        """The (variable, values) of every variable.
+
+        Permutations go through the values like nested loops, the last
+        variable innermost, so permutation number i has the values at
+        numpy.unravel_index(i, [len(values) for _, values in axes]).
+
+        """
+        return [
+            (i_iter.get_varname(), [to_number(value) for value in i_iter.data])
+            for i_iter in self.parser.variables_list
+        ]
+
+    def variables(self, perm_id):
+        """The {variable: value} of permutation perm_id."""
+        return dict(self.permutations[perm_id][1:])
+
+    def iter_permutations(self):
+        """Yields (perm_id, {variable: value}) of every permutation in order."""
+        for perm_id, var_set in enumerate(self.permutations):
+            yield perm_id, dict(var_set[1:])
+
+    def directory(self, perm_id):
+        """The output directory of perm_id, relative to output_path."""
+        if self._names is None:
+            self._names = self.directory_names()
+        return self._names[perm_id]
+
+    def directory_names(self):
+        """Names the output directory of every permutation."""
+        nset = self.permutations
+        _, nmax, allints = self._permutations
+        # The names earlier runs gave, incremental or not, so that a plan
+        # and the command line agree on an extended sweep.
+        named = self.rendered
+        if named is None:
+            named = outputs.RenderManifest.load(
+                os.path.join(self.output_path, outputs.MANIFEST_FILE)
+            )
+        if self.flat_dirs:
+            return named.flat_names(nset, self.samples, self.sizes)
+        widths = {}
+        for name, value in nmax.items():
+            if name in allints:
+                continue
+            widths[name] = named.width(name, math.ceil(math.log10(value + 1)))
+        names = []
+        for var_set in nset:
+            # Create label for output directories
+            strtag = os.path.curdir + os.path.sep
+            for ivar in var_set[1:]:
+                if ivar[0] in allints:
+                    fstr = "{0}-{1}{2}"
+                else:
+                    fstr = "{0}-{1:0" + str(widths[ivar[0]]) + "d}{2}"
+                strtag = strtag + fstr.format(ivar[0], ivar[1], os.path.sep)
+            names.append(strtag)
+        return names
+
+    def render(self, perm_id, dest=None):
+        """Creates the files of permutation perm_id in dest.
+
+        'dest' defaults to the permutation's directory in output_path.
+        Returns the number of bytes written.
+
+        """
+        if dest is None:
+            dest = os.path.join(self.output_path, self.directory(perm_id))
+        directory = None
+        if self.rendered is not None:
+            directory = os.path.relpath(dest, self.output_path)
+        var_dict = self.variables(perm_id)
+        manifest = self.manifest
+        self.make_directories(dest, manifest.rel_dirs)
+        todo = []
+        for tfile in manifest.files:
+            outfilepath = os.path.join(dest, tfile.rel_path)
+            if tfile.signature is None:
+                raise template.NotCompilable("%s: %s" % (tfile.path, tfile.error))
+            refs = ()
+            if tfile.compiled is not None:
+                refs = tuple(
+                    (name, repr(var_dict.get(name))) for name in tfile.compiled.names
+                )
+            elif self.linker.strategy(tfile.rel_path) != "copy":
+                # Changing how a binary file is put there puts it again.
+                refs = (("link_binaries", self.linker.strategy(tfile.rel_path)),)
+            if directory is not None and self.rendered.up_to_date(
+                directory, tfile.rel_path, tfile.signature, refs, outfilepath
+            ):
+                continue
+            todo.append((tfile, outfilepath, refs))
+        if self.render_threads > 1 and len(todo) > 1:
+            from concurrent.futures import ThreadPoolExecutor, wait
+
+            if self._io_pool is None:
+                self._io_pool = ThreadPoolExecutor(max_workers=self.render_threads)
+            futures = [
+                self._io_pool.submit(
+                    self.render_file, tfile, outfilepath, var_dict, directory
+                )
+                for tfile, outfilepath, _ in todo
+            ]
+            # The permutation is rendered when every file is there, or
+            # failed once none are still being written.
+            wait(futures)
+            done = [future.result() for future in futures]
+        else:
+            done = [
+                self.render_file(tfile, outfilepath, var_dict, directory)
+                for tfile, outfilepath, _ in todo
+            ]
+        if self.writer is not None:
+            self.writer.flush()
+        written = 0
+        for (tfile, outfilepath, refs), (nbytes, content) in zip(todo, done):
+            written += nbytes
+            if directory is not None:
+                self.rendered.record(
+                    directory,
+                    tfile.rel_path,
+                    tfile.signature,
+                    refs,
+                    outfilepath,
+                    content,
+                )
+        return written
+
+    def render_file(self, tfile, outfilepath, var_dict, directory=None):
+        """Renders or copies one template file to outfilepath.
+
+        Returns the bytes written and the hash of the rendered text, which
+        is only worked out for 'directory' in the RenderManifest.
+
+        """
+        if tfile.binary:
+            with self.phases.phase("copy"):
+                return (
+                    self.linker.place(tfile.path, outfilepath, tfile.rel_path),
+                    None,
+                )
+        with self.phases.phase("substitute"):
+            text = tfile.compiled.render(var_dict, globals())
+            content = None
+            # Text that comes out the same isn't written again.
+            if directory is not None:
+                content = hashlib.sha256(text.encode("utf-8")).hexdigest()
+                if self.rendered.same_content(
+                    directory, tfile.rel_path, content, outfilepath
+                ):
+                    return 0, content
+            if self.writer is not None:
+                self.writer.write(outfilepath, text, tfile.path)
+                return writer.encoded_size(text), content
+            return writer.write_file(outfilepath, text, tfile.path), content
+
+    def close(self):
+        """Stops the threads files are rendered and written with."""
+        if self._io_pool is not None:
+            self._io_pool.shutdown(wait=True)
+            self._io_pool = None
+        if self.writer is not None:
+            self.writer.close()
+
+    def make_directories(self, dest, rel_dirs):
+        """Creates dest and the template sub-directories rel_dirs in it.
+
+        rel_dirs are in the order os.walk found them, so each one comes
+        after its parent and a single mkdir makes it.  They are made
+        relative to a descriptor of dest where the platform allows it, so
+        dest isn't looked up again for every one.
+
+        """
+        dest = os.path.normpath(dest)
+        parent = os.path.dirname(dest)
+        if parent not in self._parents:
+            os.makedirs(parent, exist_ok=True)
+            self._parents.add(parent)
+        try:
+            os.mkdir(dest)
+        except FileExistsError:
+            pass
+        except FileNotFoundError:
+            # The output directory was removed since the parent was made.
+            os.makedirs(dest)
+        if not rel_dirs:
+            return
+        if os.mkdir not in os.supports_dir_fd:
+            for rel_dir in rel_dirs:
+                try:
+                    os.mkdir(os.path.join(dest, rel_dir))
+                except FileExistsError:
+                    pass
+            return
+        dest_fd = os.open(dest, os.O_RDONLY | getattr(os, "O_DIRECTORY", 0))
+        try:
+            for rel_dir in rel_dirs:
+                try:
+                    os.mkdir(rel_dir, dir_fd=dest_fd)
+                except FileExistsError:
+                    pass
+        finally:
+            os.close(dest_fd)
+
+    def save_rendered(self):
+        """Keeps what was rendered in output_path, if the plan is incremental."""
+        if self.rendered is not None:
+            self.rendered.save()
+
+    def run(self, executor=None):
+        """Renders every permutation and runs the model in it.
+
+        The model is the 'callable' or the 'program' of the [program]
+        section.  Each permutation is rendered here and the model run is
+        submitted to 'executor', a concurrent.futures.Executor, or run
+        straight away without one.  A callable changes into the directory
+        it is called in, so give it a ProcessPoolExecutor.  Returns, in
+        permutation order, what the callable returned or the exit status of
+        the program; a callable that fails raises its exception here.
+
+        A callable is imported with base_path on sys.path and PYSLICE set
+        in the environment.  That is set up in the executor's workers, which
+        keep it, or here only while the runs last.
+
+        """
+        results = []
+        if executor is None:
+            state = pymodel.worker_state(self.base_path)
+        else:
+            state = contextlib.nullcontext()
+        with state:
+            for perm_id, variables in self.iter_permutations():
+                abs_path = os.path.normpath(
+                    os.path.join(self.output_path, self.directory(perm_id))
+                )
+                self.render(perm_id, abs_path)
+                if self.model_callable is not None:
+                    call = (
+                        pymodel.call_model,
+                        self.model_callable,
+                        variables,
+                        abs_path,
+                        self.base_path,
+                    )
+                else:
+                    call = (run_program, self.program, abs_path, self.keep_log)
+                if executor is not None:
+                    results.append(executor.submit(*call))
+                    continue
+                cwd = os.getcwd()
+                try:
+                    results.append(call[0](*call[1:]))
+                finally:
+                    os.chdir(cwd)
+        self.save_rendered()
+        self.close()
+        if executor is not None:
+            results = [future.result() for future in results]
+        return results
+
+
+# ====================================
+
+
+class Pyslice(object):
+    # ---class variables---
+    # --------------------------
+
+    def __init__(self, profilers=()):
+        # ---instance variables---
+        # Marks the phases of the run, and times them if profilers are on.
+        self.phases = phases.Phases(profilers)
+        self.profile_path = None
+
+    # --------------------------
+    def read_config(self, min_sections, max_sections, req_sections_list):
+        """Reads the pyslice.ini file."""
+
+        # Can we find pyslice.ini?
+        pyslice_ini = os.path.join(os.getcwd(), input_file)
+        if not os.access(pyslice_ini, os.F_OK | os.R_OK):
+            raise ConfigFileNotFoundError(
+                "{} was not found or not readable ***".format(input_file)
+            )
+        # Read it in.
+        config_dict = configparser.ConfigParser()
+        config_dict.read(pyslice_ini)
+        check_config(config_dict, min_sections, max_sections, req_sections_list)
+
+        # Return pyslice.ini as dictionary.
+        return config_dict
+
+    def dequote(self, in_str):
+        return dequote(in_str)
+
+    def path_correction(self, path):
+        return path_correction(path)
+
+    # Runs the program in a new thread.
+    def start_thread_process(
+        self, program, *args, cwd=None, setup=None, slots=(), log_path=None
+    ):
+        """Runs program with args, retrying failures, and returns the outcome.
+
+        'program' is split like a shell command line and 'args' are added as
+        they are, so a path with spaces stays one argument.  A run longer
+        than self.timeout seconds is killed along with every process it
+        started.  Failed runs are retried up to self.max_retries times,
+        waiting self.retry_backoff seconds before the first retry and twice
+        as long before each one after.  'setup' is a launcher.ChildSetup
+        applied to the new process.  Each attempt is traced in the rows of
+        the job's 'slots'.  The output goes to 'log_path', pyslice.log in
+        cwd by default, when keep_log is set.
+
+        """
+        com = shlex.split(program) + list(args)
+        if cwd is None:
+            cwd = os.getcwd()
+
+        if self.keep_log is not True:
+            log_path = None
+        elif log_path is None:
+            log_path = os.path.join(cwd, "pyslice.log")
+
+        attempts = 0
+        while True:
+            attempts += 1
+            start = time.perf_counter()
+            try:
+                with self.phases.phase("launch"):
+                    handle = self.launcher.launch(com, cwd, log_path, setup)
+            except (OSError, ValueError, subprocess.SubprocessError) as exc:
+                # Retrying won't make the program appear, or the limits fit.
+                return {
+                    "status": launcher.LAUNCH_ERROR,
+                    "returncode": None,
+                    "error": str(exc),
+                    "attempts": attempts,
+                    "wall_time": 0.0,
+                }
+            launched = time.perf_counter()
+            self.launch_stats.record(launched - start)
+
+            timed_out = []
+            timer = None
+            if self.timeout:
+
+                def kill(handle=handle):
+                    timed_out.append(True)
+                    self.launcher.kill(handle)
+
+                timer = _threading.Timer(self.timeout, kill)
+                timer.start()
+            returncode, rusage = self.launcher.wait(handle)
+            if timer is not None:
+                timer.cancel()
+            end = time.perf_counter()
+            wall_time = end - start
+            for slot in slots:
+                tid = trace.slot_tid(slot)
+                self.trace.complete(
+                    "run", tid, start, end, {"cwd": cwd, "attempt": attempts}
+                )
+                self.trace.complete("launch", tid, start, launched)
+
+            status = launcher.classify(returncode, bool(timed_out))
+            if status == launcher.SUCCESS or attempts > self.max_retries:
+                return dict(
+                    rusage,
+                    status=status,
+                    returncode=returncode,
+                    attempts=attempts,
+                    wall_time=wall_time,
+                )
+            time.sleep(self.retry_backoff * 2 ** (attempts - 1))
+
+    def child_setup(self, slots):
+        """Returns the limits, CPUs and environment for a job in slots."""
+        cpus = None
+        if self.cpu_sets:
+            cpus = sorted(set(cpu for slot in slots for cpu in self.cpu_sets[slot]))
+        environ = None
+        if self.cores_per_job is not None:
+            environ = {"OMP_NUM_THREADS": str(len(slots))}
+        if not self.rlimits and not cpus and not environ:
+            return None
+        return launcher.ChildSetup(self.rlimits, cpus, environ)
+
+    def run_job(self, slots, waited, program, cwd, variables, render, error=None):
+        """Runs program in cwd and records the outcome.
+
+        'render' has the permutation number and how long it took to create
+        the directory and how many bytes were written.  With an 'error' the
+        program isn't run and the job is recorded as a launch error.
+
+        """
+        self.progress.started()
+        setup = self.child_setup(slots)
+        if error is not None:
+            job = self.failed_job(error)
+        else:
+            job = self.start_thread_process(program, cwd=cwd, setup=setup, slots=slots)
+        job.update(render)
+        job.update(
+            directory=cwd, variables=variables, admission_wait=waited, slots=slots
+        )
+        if setup is not None:
+            job.update(setup.to_json())
+        self.job_log.record(job)
+        if job["status"] == launcher.SUCCESS:
+            self.progress.finished(1, 0)
+        else:
+            self.progress.finished(0, 1)
+
+    def start_batch_process(
+        self,
+        slots,
+        waited,
+        program,
+        manifest,
+        batch_status,
+        directories,
+        log,
+        render,
+        error=None,
+    ):
+        """Runs program on a batch manifest and records each directory's status.
+
+        The program's output goes next to the manifest, with a '.log'
+        extension, so batches running side by side don't share one log.
+
+        """
+        self.progress.started(len(directories))
+        setup = self.child_setup(slots)
+        if error is not None:
+            job = self.failed_job(error)
+        else:
+            job = self.start_thread_process(
+                program,
+                manifest,
+                cwd=self.output_path,
+                setup=setup,
+                slots=slots,
+                log_path=os.path.splitext(manifest)[0] + ".log",
+            )
+        job.update(render)
+        job.update(
+            directory=self.output_path,
+            manifest=manifest,
+            admission_wait=waited,
+            slots=slots,
+        )
+        if setup is not None:
+            job.update(setup.to_json())
+        self.job_log.record(job)
+        statuses = batch.read_status(batch_status, directories)
+        log.record(statuses)
+        completed = sum(1 for _, status in statuses if status in progress.OK_STATUSES)
+        self.progress.finished(completed, len(statuses) - completed)
+
+    def failed_job(self, error):
+        """The outcome of a job that couldn't be started because of error."""
+        return {
+            "status": launcher.LAUNCH_ERROR,
+            "returncode": None,
+            "error": error,
+            "attempts": 0,
+            "wall_time": 0.0,
+        }
+
+    def job_needs(self, variables_list):
+        """Returns the memory in bytes and the cores for a job.
+
+        A batch job covering several permutations needs the most any of
+        them does.
+
+        """
+        memory = 0
+        cores = 1
+        for variables in variables_list:
+            if self.job_memory:
+                estimate = eval(self.job_memory, globals(), dict(variables))
+                memory = max(memory, int(estimate * scheduler.MB))
+            if self.cores_per_job:
+                estimate = eval(self.cores_per_job, globals(), dict(variables))
+                cores = max(cores, int(estimate))
+        return memory, min(cores, self.max_threads)
+
+    def queue_job(self, pending, variables_list, target, *args):
+        """Adds a job to be started as target(slots, waited, *args)."""
+        try:
+            memory, cores = self.job_needs(variables_list)
+        except Exception as exc:
+            # The job fails when it is started, the rest of the sweep runs.
+            memory, cores = 0, 1
+            target = functools.partial(
+                target, error="job_memory or cores_per_job: %r" % (exc,)
+            )
+        self.progress.queued(len(variables_list))
+        pending.append((memory, cores, time.time(), target, args))
+
+    def dispatch(self, pending, window):
+        """Starts the pending jobs as they are admitted.
+
+        A job further down 'pending' is started ahead of the first one when
+        that doesn't fit yet, which packs the slots, but only
+        self.max_passed times: then nothing else is started until the first
+        job is, so the slots it needs drain.  Returns when nothing can start
+        and 'pending' has fewer than 'window' jobs left.
+
+        """
+        while pending:
+            head, passed = self.head
+            if head is not pending[0]:
+                head, passed = pending[0], 0
+            started = False
+            for index, (memory, cores, queued, target, args) in enumerate(pending):
+                if index and passed >= self.max_passed:
+                    break
+                admitted = self.scheduler.try_acquire(memory, cores, queued)
+                if admitted is not None:
+                    del pending[index]
+                    if index:
+                        passed += 1
+                    self.start_job(admitted[0], admitted[1], target, *args)
+                    started = True
+                    break
+            self.head = (head, passed)
+            if started:
+                continue
+            if len(pending) < window:
+                return
+            start = self.trace.now()
+            with self.phases.phase("dispatch wait"):
+                self.scheduler.wait()
+            self.trace.complete("wait for slot", trace.MAIN, start, self.trace.now())
+
+    def start_job(self, slots, waited, target, *args):
+        """Runs target(slots, waited, *args) in a thread that gives back slots."""
+
+        now = self.trace.now()
+        self.trace.queued(len(self.threads), now - waited, now, {"slots": slots})
+
+        def job():
+            try:
+                target(slots, waited, *args)
+            finally:
+                self.scheduler.release(slots)
+
+        a = _threading.Thread(target=job)
+        a.start()
+        self.threads.append(a)
+
+    def callable_done(self, future):
+        """Counts a finished call of the model callable."""
+        if future.exception() is None:
+            self.progress.finished(1, 0, was="queued")
+        else:
+            self.progress.finished(0, 1, was="queued")
+
+    def write_trace(self, trace_file, slots):
+        if trace_file is None:
+            return
+        if not os.path.isdir(self.output_path):
+            os.makedirs(self.output_path)
+        self.trace.write(os.path.join(self.output_path, trace_file), slots)
+
+    def run_blocks(self, model_callable, block_size, max_workers, results_path):
+        """Hands blocks of permutations to the model callable.
+
+        No directories are created.  Each block is built from the values of
+        the variables as it is submitted, at most two per worker ahead of
+        the ones running, to a pool of worker processes and the results
+        stored column by column in results_path.
+
+        """
+        from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+        pymodel.init_worker(os.getcwd())
+        pymodel.load_callable(model_callable)
+        if not os.path.isdir(self.output_path):
+            os.makedirs(self.output_path)
+
+        axes = self.plan.axis_values()
+        total = len(self.plan)
+        blocks = []
+        outstanding = set()
+        with ProcessPoolExecutor(
+            max_workers=max_workers,
+            initializer=pymodel.init_worker,
+            initargs=(os.getcwd(),),
+        ) as pool:
+            for start in range(0, total, block_size):
+                if len(outstanding) >= 2 * max_workers:
+                    _, outstanding = wait(outstanding, return_when=FIRST_COMPLETED)
+                block = pymodel.make_block(axes, start, min(start + block_size, total))
+                future = pool.submit(pymodel.call_model_block, model_callable, block)
+                outstanding.add(future)
+                blocks.append((block, future))
+        with self.phases.phase("results"):
+            failed = pymodel.write_block_results(results_path, blocks)
+        if failed:
+            msg("%d of %d blocks failed.\n" % (failed, len(blocks)))
+
+    def run(self):
+        """Runs the sweep, profiling it if asked to."""
+        self.phases.start()
+        try:
+            self.run_sweep()
+        finally:
+            self.phases.stop()
+            report = self.phases.report(self.profile_path or os.getcwd())
+            if report is not None:
+                msg("Profile written to %s\n" % report)
+
+    def run_sweep(self):
+        ftn = "Pyslice.run"
+        debug(ftn, "hello, world")
+
+        if len(sys.argv) == 1:
+
+            toss = """
+            Pyslice renders the template directory into the output
+            directories.  Files pyslice rendered before are only rendered
+            again if their template, or a variable they use, changed, or if
+            they were changed or removed since.  Other files with the same
+            name as a template file are replaced.  A sweep with new values
+            keeps the directories of earlier runs and adds directories for
+            the new permutations.  To render every file again, set
+            'incremental=no' in the [flags] section or remove
+            'pyslice_rendered.pickle' from the output directory.
+
+            'Press "Enter" to continue . . .' """
+            _ = input(toss)
+
+        # Read the configuration file and set appropriate variables.
+        phase = self.phases.begin("config")
+        configuration = self.read_config(4, 100, ["paths", "flags", "program"])
+        max_threads = configuration.getint("flags", "max_threads")
+        if max_threads <= 0:
+            max_threads = total_processes
+        self.timeout = 0
+        if configuration.has_option("flags", "timeout"):
+            self.timeout = configuration.getfloat("flags", "timeout")
+        self.max_retries = 0
+        if configuration.has_option("flags", "max_retries"):
+            self.max_retries = configuration.getint("flags", "max_retries")
+        self.retry_backoff = 1.0
+        if configuration.has_option("flags", "retry_backoff"):
+            self.retry_backoff = configuration.getfloat("flags", "retry_backoff")
+        self.max_threads = max_threads
+        # Admission control, memory is given in MB.
+        self.job_memory = None
+        if configuration.has_option("flags", "job_memory"):
+            # An expression, its quotes are string literals.
+            self.job_memory = configuration.get("flags", "job_memory")
+        # With cores_per_job, max_threads is the number of cores to fill.
+        self.cores_per_job = None
+        if configuration.has_option("flags", "cores_per_job"):
+            self.cores_per_job = configuration.get("flags", "cores_per_job")
+        memory_reserve = 0
+        if configuration.has_option("flags", "memory_reserve"):
+            memory_reserve = int(
+                configuration.getfloat("flags", "memory_reserve") * scheduler.MB
+            )
+        max_load = None
+        if configuration.has_option("flags", "max_load"):
+            max_load = configuration.getfloat("flags", "max_load")
+        # Per job resource limits and CPU pinning.
+        self.rlimits = []
+        for name in sorted(launcher.RLIMITS):
+            if configuration.has_option("flags", name):
+                value = configuration.getfloat("flags", name)
+                if name == "limit_memory":
+                    value = value * scheduler.MB
+                self.rlimits.append((name, int(value)))
+        self.cpu_sets = None
+        if configuration.has_option("flags", "cpu_affinity"):
+            if configuration.getboolean("flags", "cpu_affinity"):
+                self.cpu_sets = scheduler.cpu_sets(max_threads)
+        order = "odometer"
+        if configuration.has_option("flags", "order"):
+            order = self.dequote(configuration.get("flags", "order"))
+            if order not in scheduler.ORDERS:
+                raise NotValidTypeError(
+                    "'%s' is not a valid order - %s" % (order, scheduler.ORDERS)
+                )
+        runtime_estimate = None
+        if configuration.has_option("flags", "runtime_estimate"):
+            # An expression, its quotes are string literals.
+            runtime_estimate = configuration.get("flags", "runtime_estimate")
+        # Timeline of the run for chrome://tracing, relative to output_path.
+        trace_file = None
+        if configuration.has_option("flags", "trace_file"):
+            trace_file = self.dequote(configuration.get("flags", "trace_file"))
+        # Progress is written to status_file, relative to output_path, every
+        # progress_interval seconds.
+        status_file = "pyslice_status.json"
+        if configuration.has_option("flags", "status_file"):
+            status_file = self.dequote(configuration.get("flags", "status_file"))
+        progress_interval = 2.0
+        if configuration.has_option("flags", "progress_interval"):
+            progress_interval = configuration.getfloat("flags", "progress_interval")
+        progress_port = None
+        if configuration.has_option("flags", "progress_port"):
+            progress_port = configuration.getint("flags", "progress_port")
+        plan_cache = True
+        if configuration.has_option("flags", "plan_cache"):
+            plan_cache = configuration.getboolean("flags", "plan_cache")
+        # Only render again what changed since the last run.
+        incremental = True
+        if configuration.has_option("flags", "incremental"):
+            incremental = configuration.getboolean("flags", "incremental")
+        launcher_name = "popen"
+        if configuration.has_option("flags", "launcher"):
+            launcher_name = self.dequote(configuration.get("flags", "launcher"))
+            if launcher_name not in launcher.LAUNCHERS:
+                raise NotValidTypeError(
+                    "'%s' is not a valid launcher - %s"
+                    % (launcher_name, launcher.LAUNCHERS)
+                )
+
+        # The variables, permutations and compiled templates.
+        cache_key = None
+        if plan_cache:
+            cache_key = plancache.make_key(input_file, __version__)
+        self.plan = Plan(
+            configuration, os.getcwd(), cache_key, self.phases, incremental
+        )
+        self.output_path = self.plan.output_path
+        self.keep_log = self.plan.keep_log
+        self.profile_path = self.output_path
+        flat_dirs = self.plan.flat_dirs
+
+        # A Python function can stand in for the external program.
+        model_callable = self.plan.model_callable
+        program = self.plan.program
+        vectorized = False
+        if configuration.has_option("program", "vectorized"):
+            vectorized = configuration.getboolean("program", "vectorized")
+        if vectorized and model_callable is None:
+            raise RequiredOptionNotFoundError(
+                "'vectorized' in [program] requires the 'callable' option."
+            )
+        block_size = 1024
+        if configuration.has_option("program", "block_size"):
+            block_size = max(configuration.getint("program", "block_size"), 1)
+        batch_size = 1
+        if configuration.has_option("program", "batch_size"):
+            batch_size = max(configuration.getint("program", "batch_size"), 1)
+        results_file = "pyslice_results.jsonl"
+        if vectorized:
+            results_file = "pyslice_results.npz"
+        if configuration.has_option("program", "results_file"):
+            results_file = self.dequote(configuration.get("program", "results_file"))
+
+        self.phases.end(phase)
+
+        # Size up the sweep before anything is enumerated.
+        sizes = self.plan.sizes
+        template_size = None
+        if not vectorized:
+            template_size = self.plan.manifest.usage()
+        msg(
+            preview.summary(
+                sizes,
+                template_size,
+                flat_dirs,
+                self.keep_log and model_callable is None,
+                directories_made=not vectorized,
+            )
+        )
 
         while 1:
             try:
@@ -556,7 +1341,7 @@ class Pyslice(object):
 
             toss = (
                 "Configuration results in %s permutations. " "Continue? (y/n) > "
-            ) % (len(nset),)
+            ) % (preview.count(sizes),)
             inp = input(toss)
             if not inp:
                 continue
@@ -567,40 +1352,195 @@ class Pyslice(object):
                 return
             continue
 
-        nlen = len(str(len(nset)))
-        for var_index, var_set in enumerate(nset):
-            # Create label for output directories
-            if flat_dirs:
-                _strtag = str(var_index + 1).zfill(nlen)
-            else:
-                _strtag = os.path.curdir + os.path.sep
-                for ivar in var_set[1:]:
-                    if ivar[0] in allints:
-                        fstr = "{0}-{1}{2}"
-                    else:
-                        fstr = (
-                            "{0}-{1:0"
-                            + str(math.ceil(math.log10(nmax[ivar[0]] + 1)))
-                            + "d}{2}"
-                        )
-                    _strtag = _strtag + fstr.format(ivar[0], ivar[1], os.path.sep)
+        if vectorized:
+            self.run_blocks(
+                model_callable,
+                block_size,
+                max_threads,
+                os.path.join(self.output_path, results_file),
+            )
+            return
 
-            # Create the files and directories from the template
-            # Walks the _template_path directory structure
-            # os.path.walk(_template_path, self.create_output, var_set)
-            for root, dirs, files in os.walk(_template_path):
-                self.create_output(var_set, root, dirs, files)
+        nset = self.plan.permutations
 
-            # Wait until there are less than max_threads.
-            while _threading.activeCount() > max_threads:
-                time.sleep(0.1)
+        if trace_file is None:
+            self.trace = trace.NullTrace()
+        else:
+            self.trace = trace.Trace()
+        if not os.path.isdir(self.output_path):
+            os.makedirs(self.output_path)
+        self.progress = progress.Progress(
+            len(nset),
+            os.path.join(self.output_path, status_file),
+            progress_interval,
+            progress_port,
+        )
+        self.progress.begin()
+
+        if model_callable is not None:
+            # Fail on a bad 'callable' before any directories are made.  On
+            # platforms that fork, the workers also inherit the import.
+            pymodel.init_worker(os.getcwd())
+            pymodel.load_callable(model_callable)
+            from concurrent.futures import ProcessPoolExecutor
+
+            pool = ProcessPoolExecutor(
+                max_workers=max_threads,
+                initializer=pymodel.init_worker,
+                initargs=(os.getcwd(),),
+            )
+            jobs = []
+
+        if model_callable is None:
+            # PYSLICE can be used in subprocess to do different things if
+            # script is run outside of Pyslice.
+            os.environ["PYSLICE"] = "1"
+            self.launcher = launcher.make_launcher(launcher_name)
+            self.launch_stats = launcher.LaunchStats()
+            self.scheduler = scheduler.Scheduler(
+                max_threads, memory_reserve=memory_reserve, max_load=max_load
+            )
+            self.threads = []
+            if not os.path.isdir(self.output_path):
+                os.makedirs(self.output_path)
+            self.job_log = joblog.JobLog(
+                os.path.join(self.output_path, "pyslice_jobs.jsonl")
+            )
 
-            abs_path = os.path.join(_output_path, _strtag)
+        if batch_size > 1:
+            batch_path = os.path.join(self.output_path, "pyslice_batches")
+            status_log = batch.StatusLog(
+                os.path.join(self.output_path, "pyslice_batch_status.txt")
+            )
+            batch_dirs = []
+            batch_vars = []
+            batch_render = {"permutations": [], "render_time": 0.0, "bytes_written": 0}
+            batch_no = 0
+        pending = []
+        # The first pending job and how many were started ahead of it, at
+        # most max_threads.
+        self.head = (None, 0)
+        self.max_passed = max_threads
+
+        phase = self.phases.begin("schedule")
+        schedule = range(len(nset))
+        if order == "longest_first":
+            if runtime_estimate is not None:
+                estimates = [
+                    eval(runtime_estimate, globals(), dict(var_set[1:]))
+                    for var_set in nset
+                ]
+            else:
+                # Learn from the runtimes recorded by earlier runs.
+                runtimes = scheduler.learned_runtimes(
+                    os.path.join(self.output_path, "pyslice_jobs.jsonl")
+                )
+                estimates = [
+                    runtimes.get(scheduler.runtime_key(dict(var_set[1:])))
+                    for var_set in nset
+                ]
+            schedule = scheduler.longest_first(estimates)
+        self.phases.end(phase)
 
-            os.chdir(abs_path)
+        for position, var_index in enumerate(schedule):
+            var_set = nset[var_index]
+            abs_path = os.path.join(self.output_path, self.plan.directory(var_index))
 
-            a = _threading.Thread(target=self.start_thread_process, args=(program,))
-            a.start()
+            # Create the files and directories from the template
+            render_start = time.perf_counter()
+            with self.phases.phase("render"):
+                bytes_written = self.plan.render(var_index, abs_path)
+            render_end = time.perf_counter()
+            render = {
+                "permutation": var_index,
+                "render_time": render_end - render_start,
+                "bytes_written": bytes_written,
+            }
+            self.trace.complete("render", trace.MAIN, render_start, render_end, render)
+            self.progress.rendered()
+
+            if model_callable is not None:
+                abs_path = os.path.normpath(abs_path)
+                variables = dict(var_set[1:])
+                future = pool.submit(
+                    pymodel.call_model, model_callable, variables, abs_path
+                )
+                self.progress.queued()
+                future.add_done_callback(self.callable_done)
+                jobs.append((var_index, abs_path, variables, future))
+                continue
+
+            if batch_size > 1:
+                batch_dirs.append(os.path.normpath(abs_path))
+                batch_vars.append(dict(var_set[1:]))
+                batch_render["permutations"].append(var_index)
+                batch_render["render_time"] += render["render_time"]
+                batch_render["bytes_written"] += bytes_written
+                if len(batch_dirs) < batch_size and position + 1 < len(nset):
+                    continue
+                batch_no += 1
+                manifest, batch_status = batch.write_manifest(
+                    batch_path, batch_no, batch_dirs
+                )
+                self.queue_job(
+                    pending,
+                    batch_vars,
+                    self.start_batch_process,
+                    program,
+                    manifest,
+                    batch_status,
+                    batch_dirs,
+                    status_log,
+                    batch_render,
+                )
+                batch_dirs = []
+                batch_vars = []
+                batch_render = {
+                    "permutations": [],
+                    "render_time": 0.0,
+                    "bytes_written": 0,
+                }
+            else:
+                variables = dict(var_set[1:])
+                self.queue_job(
+                    pending,
+                    [variables],
+                    self.run_job,
+                    program,
+                    os.path.normpath(abs_path),
+                    variables,
+                    render,
+                )
+
+            # Start what can be admitted, and wait once enough jobs are
+            # rendered and waiting.
+            self.dispatch(pending, max_threads)
+        self.plan.save_rendered()
+        self.plan.close()
+        msg(self.plan.linker.summary())
+
+        if model_callable is not None:
+            with self.phases.phase("drain"):
+                pool.shutdown(wait=True)
+            with self.phases.phase("results"):
+                pymodel.write_results(
+                    os.path.join(self.output_path, results_file), jobs
+                )
+            self.write_trace(trace_file, max_threads)
+            self.progress.stop()
+            return
+
+        with self.phases.phase("drain"):
+            self.dispatch(pending, 0)
+            for a in self.threads:
+                a.join()
+        self.launcher.close()
+        self.write_trace(trace_file, max_threads)
+        self.progress.stop()
+        msg(self.launch_stats.summary())
+        msg(self.scheduler.summary())
+        msg(self.job_log.summary())
+        msg(self.job_log.metrics_table())
 
 
 # =============================
@@ -613,10 +1553,20 @@ def main(argv=None):
     if argv is None:
         argv = sys.argv
 
-    option_dict = {"debug": 0, "file": ""}
+    option_dict = {"debug": 0, "file": "", "profilers": []}
     try:
         opts, _ = getopt.getopt(
-            argv[1:], "hvdf:", ["help", "version", "debug", "file="]
+            argv[1:],
+            "hvdpf:",
+            [
+                "help",
+                "version",
+                "debug",
+                "file=",
+                "profile",
+                "profile-cpu",
+                "profile-memory",
+            ],
         )
     except getopt.error as msg:
         raise Usage(msg)
@@ -632,13 +1582,21 @@ def main(argv=None):
         elif opt[0] == "-d" or opt[0] == "--debug":
             option_dict["debug"] = 1
             sys.argv.remove(opt[0])
+        elif opt[0] in ["-p", "--profile", "--profile-cpu", "--profile-memory"]:
+            if "time" not in option_dict["profilers"]:
+                option_dict["profilers"].append("time")
+            if opt[0] == "--profile-cpu":
+                option_dict["profilers"].append("cpu")
+            if opt[0] == "--profile-memory":
+                option_dict["profilers"].append("memory")
+            argv.remove(opt[0])
         elif opt[0] == "-f" or opt[0] == "--file":
             option_dict["file"] = opt[1]
             argv.remove(opt[0])
             argv.remove(opt[1])
 
     # ---make the object and run it---
-    main_x = Pyslice()
+    main_x = Pyslice(option_dict["profilers"])
     main_x.run()
 
 
@@ -186,9 +186,9 @@ class Agrizer(ParamParser):
                 if mustCalculateDif:
 
                     ls = [ls[i + 1] - ls[i] for i in range(len(ls) - 1)]
-                from . import histogram
+                from .histogram import SPGHistogram
 
-                hist = histogram.SPGHistogram(self.box_size)
+                hist = SPGHistogram(self.box_size)
 
                 for x in ls:
                     hist.add_value(x)
@@ -10,11 +10,95 @@ release_date = "Wed Sep 30 2003"
 # Please visit www.gnu.org
 #
 
+# The modules are imported when one of their names is first used, so that
+# pyslice, which only needs ParamParser, doesn't import numpy and the
+# plotting modules.  Each module's names are put in the package as the
+# 'from module import *' that used to be here did, in the same order.
 
-from .Agrizer import *
-from .Executor import *
-from .MatrixPlotter import *
-from .MeanCalculation import *
-from .MultiAgrizer import *
-from .ParamParser import *
-from .TeXParser import *
+import importlib as _importlib
+import math as _math
+
+# Modules whose names are put in the package, in the order they used to be
+# imported.
+_MODULES = [
+    "Agrizer",
+    "Executor",
+    "MatrixPlotter",
+    "MeanCalculation",
+    "MultiAgrizer",
+    "ParamParser",
+    "TeXParser",
+]
+
+# Module files that are only used as modules, by 'from . import Load' in the
+# modules above or as PySPG.Load.  They are imported on their own, without
+# the rest.
+_SUBMODULES = ["Load", "ParamIterators", "PyGrace"]
+
+# What the modules export besides the math functions of their
+# 'from math import *', for dir() before any of them is loaded.  numpy and
+# histogram are only there when numpy is installed.
+_NAMES = (
+    _MODULES
+    + _SUBMODULES
+    + [
+        "absolute_import",
+        "division",
+        "dumpData",
+        "histogram",
+        "loadData",
+        "loadXY",
+        "loadXYZ",
+        "loadY",
+        "map",
+        "next",
+        "numpy",
+        "object",
+        "old_div",
+        "os",
+        "print_function",
+        "range",
+        "release_date",
+        "str",
+        "sys",
+        "transformXY",
+        "transformXYZ",
+        "version_number",
+    ]
+)
+
+
+def _load(modname):
+    module = _importlib.import_module("." + modname, __name__)
+    names = getattr(module, "__all__", None)
+    if names is None:
+        names = [i for i in vars(module) if not i.startswith("_")]
+    globals().update((name, getattr(module, name)) for name in names)
+
+
+def __getattr__(name):
+    if name in _SUBMODULES:
+        return _importlib.import_module("." + name, __name__)
+    if name == "histogram":
+        # Load's function, which 'from .Load import *' in MeanCalculation
+        # put in the package, not the histogram module.  Importing the
+        # module, as Agrizer does, binds the name to it from then on.
+        return _importlib.import_module(".Load", __name__).histogram
+    if name in _MODULES:
+        # The class, not the module of the same name.
+        _load(name)
+    elif name == "__all__" or not name.startswith("_"):
+        for modname in _MODULES:
+            _load(modname)
+    if name == "__all__":
+        return sorted(i for i in globals() if not i.startswith("_"))
+    try:
+        return globals()[name]
+    except KeyError:
+        raise AttributeError("module %r has no attribute %r" % (__name__, name))
+
+
+def __dir__():
+    names = set(globals()) | set(_NAMES)
+    names.update(i for i in dir(_math) if not i.startswith("_"))
+    return sorted(names)
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""
+Run one program invocation over a batch of permutation directories.
+
+The program gets a manifest file with one permutation directory per line.
+It reports back by writing a status file next to the manifest, with the same
+name but a '.status' extension, that has one '<directory> <status>' line for
+each directory it handled.
+"""
+
+from __future__ import absolute_import, print_function
+
+import os
+import threading
+
+
+def write_manifest(batch_path, batch_no, directories):
+    """Writes the manifest for batch number 'batch_no'.
+
+    Returns the paths of the manifest and of the status file the program is
+    expected to write.
+
+    """
+    if not os.path.isdir(batch_path):
+        os.makedirs(batch_path)
+    stem = os.path.join(batch_path, "batch-{:05d}".format(batch_no))
+    manifest = stem + ".manifest"
+    status_file = stem + ".status"
+    # A status file left from a previous run would be misread as this one.
+    if os.path.exists(status_file):
+        os.remove(status_file)
+    with open(manifest, "w") as fpo:
+        fpo.write("".join(directory + "\n" for directory in directories))
+    return manifest, status_file
+
+
+def read_status(status_file, directories):
+    """Returns (directory, status) for every directory in the batch.
+
+    Directories that are not in the status file, or all of them if the
+    program did not write one, get the status 'missing'.
+
+    """
+    reported = {}
+    if os.path.exists(status_file):
+        with open(status_file, "r") as fpi:
+            for line in fpi:
+                words = line.rsplit(None, 1)
+                if len(words) != 2:
+                    continue
+                reported[os.path.normpath(words[0])] = words[1]
+    return [
+        (directory, reported.get(os.path.normpath(directory), "missing"))
+        for directory in directories
+    ]
+
+
+class StatusLog(object):
+    """Collects the per-permutation status of all batches in one file."""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        # Start a fresh log for this run.
+        open(self.path, "w").close()
+
+    def record(self, statuses):
+        with self.lock:
+            with open(self.path, "a") as fpo:
+                for directory, status in statuses:
+                    fpo.write("{}\t{}\n".format(directory, status))
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""
+Append-only record of every job pyslice ran.
+
+Each job is one JSON line in 'pyslice_jobs.jsonl' in the output directory.
+Lines from earlier runs are kept; every line carries the time the run started
+in 'run' so that runs can be told apart.  Besides the outcome a line has the
+permutation number and variables, the time taken and bytes written to create
+the directory, and the wall time, CPU times, maximum resident set size and
+block I/O of the model process.
+"""
+
+from __future__ import absolute_import, print_function
+
+import json
+import threading
+import time
+
+
+class JobLog(object):
+    def __init__(self, path):
+        self.path = path
+        self.run = time.strftime("%Y-%m-%dT%H:%M:%S")
+        self.lock = threading.Lock()
+        self.counts = {}
+        self.jobs = []
+
+    def record(self, job):
+        job = dict(job, run=self.run)
+        line = json.dumps(job, default=repr) + "\n"
+        with self.lock:
+            self.counts[job["status"]] = self.counts.get(job["status"], 0) + 1
+            self.jobs.append(job)
+            with open(self.path, "a") as fpo:
+                fpo.write(line)
+
+    def summary(self):
+        if not self.counts:
+            return ""
+        return (
+            "Jobs: "
+            + ", ".join(
+                "{} {}".format(count, status)
+                for status, count in sorted(self.counts.items())
+            )
+            + "\n"
+        )
+
+    # (label, key in the job record, scale)
+    metrics = [
+        ("wall time (s)", "wall_time", 1.0),
+        ("user CPU (s)", "user_time", 1.0),
+        ("system CPU (s)", "system_time", 1.0),
+        ("max RSS (MB)", "max_rss_kb", 1.0 / 1024),
+        ("block input", "block_in", 1.0),
+        ("block output", "block_out", 1.0),
+        ("render time (s)", "render_time", 1.0),
+        ("written (MB)", "bytes_written", 1.0 / 1024 / 1024),
+    ]
+
+    def metrics_table(self, slowest=5):
+        """Returns a table of the job metrics and the slowest jobs."""
+        if not self.jobs:
+            return ""
+        lines = ["{:<18}{:>12}{:>12}{:>12}".format("", "mean", "max", "total")]
+        for label, key, scale in self.metrics:
+            values = [job[key] * scale for job in self.jobs if key in job]
+            if not values:
+                continue
+            lines.append(
+                "{:<18}{:>12.3f}{:>12.3f}{:>12.3f}".format(
+                    label, sum(values) / len(values), max(values), sum(values)
+                )
+            )
+        lines.append("Slowest jobs:")
+        for job in sorted(self.jobs, key=lambda i: -i["wall_time"])[:slowest]:
+            lines.append(
+                "{:>12.3f} s  {}".format(
+                    job["wall_time"], job.get("variables") or job["directory"]
+                )
+            )
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,554 @@
+# -*- coding: utf-8 -*-
+"""
+Start the model processes.
+
+There are three ways to create a model process, selected with 'launcher' in
+the [flags] section of pyslice.ini:
+
+    popen        subprocess.Popen from the pyslice process.  The default.
+    posix_spawn  os.posix_spawn, which does not copy the pyslice process.
+    forkserver   a small helper process, started before pyslice has grown,
+                 creates the model processes on request.
+
+All of them give the same interface: launch(args, cwd, log_path, setup)
+returns a handle, wait(handle) returns the return code, negative if the
+process was killed by a signal, and the resource usage of the process, and
+kill(handle) kills the process and everything it started.  Each model
+process is started in its own session so that its whole process group can be
+killed.  'setup' is an optional ChildSetup with resource limits and a CPU
+set for the new process.
+
+This module only uses the standard library because it is also run as the
+fork server helper script.
+"""
+
+from __future__ import absolute_import, print_function
+
+import errno
+import json
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import threading
+
+try:
+    import resource
+except ImportError:
+    # Windows
+    resource = None
+
+LAUNCHERS = ["popen", "posix_spawn", "forkserver"]
+
+# How a job ended.
+SUCCESS = "success"
+NONZERO_EXIT = "nonzero_exit"
+TIMEOUT = "timeout"
+SIGNAL = "signal"
+LAUNCH_ERROR = "launch_error"
+
+
+def classify(returncode, timed_out=False):
+    """Returns how a job ended from its return code."""
+    if timed_out:
+        return TIMEOUT
+    if returncode is None:
+        return LAUNCH_ERROR
+    if returncode < 0:
+        return SIGNAL
+    if returncode > 0:
+        return NONZERO_EXIT
+    return SUCCESS
+
+
+def _kill_group(pid):
+    """Kills the process group led by pid."""
+    try:
+        os.killpg(pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        # Already gone.
+        pass
+
+
+def _exitcode(status):
+    """Converts a wait status into a subprocess style return code."""
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status)
+    return os.WEXITSTATUS(status)
+
+
+class ChildSetup(object):
+    """Resource limits, CPU affinity and environment for a model process.
+
+    'rlimits' is a list of (name, value) where name is one of RLIMITS,
+    'cpus' a list of CPU numbers and 'environ' a dictionary of environment
+    variables to set, any may be empty.  The launchers start the model
+    through a shell that waits on its stdin until apply_to has set up the
+    shell's process from pyslice, and then replaces itself with the model,
+    which inherits the limits and affinity.  Where there is no prlimit the
+    shell sets the limits with 'ulimit' instead.  A CPU set is ignored where
+    the platform can't pin processes.
+
+    """
+
+    def __init__(self, rlimits=(), cpus=None, environ=None):
+        self.rlimits = [list(i) for i in rlimits]
+        self.cpus = list(cpus) if cpus else []
+        self.environ = dict(environ) if environ else {}
+
+    def env(self):
+        """The environment for the new process, None to inherit this one."""
+        if not self.environ:
+            return None
+        return dict(os.environ, **self.environ)
+
+    def limits(self):
+        """Yields (name, value) with each value capped by the hard limit of
+        this process, which the new process inherits."""
+        for name, value in self.rlimits:
+            hard = resource.getrlimit(getattr(resource, RLIMITS[name]))[1]
+            if hard != resource.RLIM_INFINITY:
+                value = min(value, hard)
+            yield name, value
+
+    def apply_to(self, pid):
+        """Applies the limits to process pid, 0 is the current process."""
+        for name, value in self.limits():
+            res = getattr(resource, RLIMITS[name])
+            if pid == 0:
+                resource.setrlimit(res, (value, value))
+            else:
+                resource.prlimit(pid, res, (value, value))
+        if self.cpus and hasattr(os, "sched_setaffinity"):
+            os.sched_setaffinity(pid, self.cpus)
+
+    def ulimit_script(self):
+        """Shell commands that set the limits, each followed by '&& '."""
+        return "".join(
+            "ulimit %s %d && " % (ULIMITS[name][0], value // ULIMITS[name][1])
+            for name, value in self.limits()
+        )
+
+    def to_json(self):
+        return {"rlimits": self.rlimits, "cpus": self.cpus, "environ": self.environ}
+
+
+# Names of the limits in pyslice.ini and the matching resource.RLIMIT_*.
+RLIMITS = {
+    "limit_memory": "RLIMIT_AS",
+    "limit_cpu_time": "RLIMIT_CPU",
+    "limit_open_files": "RLIMIT_NOFILE",
+}
+
+# The 'ulimit' option of each limit and the bytes or seconds in its unit.
+ULIMITS = {
+    "limit_memory": ("-v", 1024),
+    "limit_cpu_time": ("-t", 1),
+    "limit_open_files": ("-n", 1),
+}
+
+# Shell script that waits for a line on stdin, then runs its arguments with
+# stdin closed.
+GATE_SCRIPT = 'read _ && exec </dev/null && exec "$@"'
+
+
+def _rusage(ru):
+    """The resource usage from os.wait4 as a dictionary."""
+    max_rss = ru.ru_maxrss
+    if sys.platform == "darwin":
+        # bytes on macOS, kilobytes everywhere else
+        max_rss = max_rss // 1024
+    return {
+        "user_time": ru.ru_utime,
+        "system_time": ru.ru_stime,
+        "max_rss_kb": max_rss,
+        "block_in": ru.ru_inblock,
+        "block_out": ru.ru_oublock,
+    }
+
+
+def _wait4(pid):
+    """Waits for pid, returns the return code and the resource usage."""
+    _, status, ru = os.wait4(pid, 0)
+    return _exitcode(status), _rusage(ru)
+
+
+def _wait_popen(proc):
+    """Waits for a Popen process, returns the return code and resource usage."""
+    if not hasattr(os, "wait4"):
+        return proc.wait(), {}
+    returncode, rusage = _wait4(proc.pid)
+    # Tell Popen it has been reaped.
+    proc.returncode = returncode
+    return returncode, rusage
+
+
+def _find_program(program, cwd, env):
+    """Raises the error Popen would if program can't be run from cwd."""
+    if os.sep not in program:
+        path = (env or os.environ).get("PATH", os.defpath)
+        if shutil.which(program, path=path) is None:
+            raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), program)
+    elif shutil.which(os.path.join(cwd or os.curdir, program)) is None:
+        raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), program)
+
+
+def _popen(args, cwd, log_path, setup=None):
+    """Popen with stdin closed and stdout and stderr sent to log_path."""
+    env = None
+    gate = False
+    if setup is not None:
+        env = setup.env()
+        if (setup.rlimits or setup.cpus) and os.name != "nt":
+            # The limits are set from here, not with a preexec_fn, which
+            # isn't safe with threads.  The shell keeps the model's pid.
+            _find_program(args[0], cwd, env)
+            if hasattr(resource, "prlimit"):
+                gate = True
+                script = GATE_SCRIPT
+            else:
+                # No pinning either where there is no prlimit.
+                script = setup.ulimit_script() + 'exec "$@"'
+            args = ["/bin/sh", "-c", script, "sh"] + list(args)
+    if log_path:
+        stdout = open(log_path, "wb")
+    else:
+        stdout = subprocess.DEVNULL
+    try:
+        if os.name != "nt":
+            proc = subprocess.Popen(
+                args,
+                cwd=cwd,
+                stdin=subprocess.PIPE if gate else subprocess.DEVNULL,
+                stdout=stdout,
+                stderr=subprocess.STDOUT,
+                close_fds=True,
+                start_new_session=True,
+                env=env,
+            )
+            if gate:
+                try:
+                    setup.apply_to(proc.pid)
+                except (OSError, ValueError):
+                    _kill_group(proc.pid)
+                    proc.stdin.close()
+                    proc.wait()
+                    raise
+                proc.stdin.write(b"\n")
+                proc.stdin.close()
+            return proc
+        # close_fds is not supported on Windows
+        return subprocess.Popen(
+            args,
+            cwd=cwd,
+            stdin=subprocess.DEVNULL,
+            stdout=stdout,
+            stderr=subprocess.STDOUT,
+            env=env,
+        )
+    finally:
+        if log_path:
+            stdout.close()
+
+
+class PopenLauncher(object):
+    name = "popen"
+
+    def launch(self, args, cwd, log_path, setup=None):
+        return _popen(args, cwd, log_path, setup)
+
+    def wait(self, proc):
+        return _wait_popen(proc)
+
+    def kill(self, proc):
+        if os.name == "nt":
+            proc.kill()
+        else:
+            _kill_group(proc.pid)
+
+    def close(self):
+        pass
+
+
+class PosixSpawnLauncher(object):
+    name = "posix_spawn"
+
+    def launch(self, args, cwd, log_path, setup=None):
+        file_actions = [
+            (os.POSIX_SPAWN_OPEN, 0, os.devnull, os.O_RDONLY, 0),
+            (
+                os.POSIX_SPAWN_OPEN,
+                1,
+                log_path or os.devnull,
+                os.O_WRONLY | os.O_CREAT | os.O_TRUNC,
+                0o666,
+            ),
+            (os.POSIX_SPAWN_DUP2, 1, 2),
+        ]
+        # posix_spawn cannot change the working directory, so a shell does
+        # the 'cd' and then replaces itself with the model.
+        script = 'cd "$0" && exec "$@"'
+        env = None
+        gate = None
+        if setup is not None:
+            env = setup.env()
+            if setup.rlimits or setup.cpus:
+                # There is no hook in the child, so the limits are set from
+                # here.  The shell waits for a line on stdin before it starts
+                # the model, which inherits them along with every thread it
+                # starts.
+                gate = os.pipe()
+                file_actions[0] = (os.POSIX_SPAWN_DUP2, gate[0], 0)
+                script = "read _ && exec </dev/null && " + script
+        argv = ["/bin/sh", "-c", script, cwd] + list(args)
+        try:
+            pid = os.posix_spawn(
+                "/bin/sh",
+                argv,
+                env or os.environ,
+                file_actions=file_actions,
+                setsid=True,
+            )
+            if gate is not None:
+                try:
+                    setup.apply_to(pid)
+                except (OSError, ValueError):
+                    _kill_group(pid)
+                    os.waitpid(pid, 0)
+                    raise
+                os.write(gate[1], b"\n")
+        finally:
+            if gate is not None:
+                os.close(gate[0])
+                os.close(gate[1])
+        return pid
+
+    def wait(self, pid):
+        return _wait4(pid)
+
+    def kill(self, pid):
+        _kill_group(pid)
+
+    def close(self):
+        pass
+
+
+class _ServerJob(object):
+    def __init__(self):
+        self.started = threading.Event()
+        self.exited = threading.Event()
+        self.pid = None
+        self.error = None
+        self.returncode = None
+        self.rusage = {}
+
+
+class ForkServerLauncher(object):
+    """Asks a helper process to create the model processes.
+
+    The helper is this module run as a script, started while pyslice is
+    still small.  Requests and replies are JSON lines over the helper's
+    stdin and stdout.
+
+    """
+
+    name = "forkserver"
+
+    def __init__(self):
+        # This file is run without its directory, or the current one, on
+        # the path, where the modules next to it, like 'trace', would hide
+        # the standard library ones.
+        self.server = subprocess.Popen(
+            [
+                sys.executable,
+                "-c",
+                "import runpy, sys; del sys.path[0]; "
+                "runpy.run_path(sys.argv[1], run_name='__main__')",
+                os.path.abspath(__file__),
+            ],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            close_fds=True,
+        )
+        self.lock = threading.Lock()
+        self.jobs = {}
+        self.next_id = 0
+        self.reader = threading.Thread(target=self._read_replies)
+        self.reader.daemon = True
+        self.reader.start()
+
+    def launch(self, args, cwd, log_path, setup=None):
+        job = _ServerJob()
+        request = {"args": list(args), "cwd": cwd, "log": log_path}
+        if setup is not None:
+            request["setup"] = setup.to_json()
+        with self.lock:
+            self.next_id += 1
+            request["id"] = self.next_id
+            self.jobs[self.next_id] = job
+            self.server.stdin.write((json.dumps(request) + "\n").encode("utf-8"))
+            self.server.stdin.flush()
+        job.started.wait()
+        if job.error is not None:
+            raise OSError(job.error)
+        return job
+
+    def wait(self, job):
+        job.exited.wait()
+        return job.returncode, job.rusage
+
+    def kill(self, job):
+        # The helper started the process in its own session, so the group
+        # can be killed from here.
+        _kill_group(job.pid)
+
+    def _read_replies(self):
+        for line in self.server.stdout:
+            reply = json.loads(line.decode("utf-8"))
+            with self.lock:
+                job = self.jobs[reply["id"]]
+                if "returncode" in reply or "error" in reply:
+                    del self.jobs[reply["id"]]
+            if "pid" in reply:
+                job.pid = reply["pid"]
+                job.started.set()
+            elif "error" in reply:
+                job.error = reply["error"]
+                job.started.set()
+                job.exited.set()
+            else:
+                job.returncode = reply["returncode"]
+                job.rusage = reply["rusage"]
+                job.exited.set()
+        # The helper is gone, nothing more will be heard about these.
+        with self.lock:
+            jobs = list(self.jobs.values())
+            self.jobs.clear()
+        for job in jobs:
+            if not job.started.is_set():
+                job.error = "fork server exited"
+            job.started.set()
+            job.exited.set()
+
+    def close(self):
+        self.server.stdin.close()
+        self.server.wait()
+        self.reader.join()
+
+
+def serve():
+    """Main loop of the fork server helper process."""
+    out_lock = threading.Lock()
+    cond = threading.Condition()
+    # pid -> (request id, Popen) of the running jobs, and the pids reaped
+    # before they were added
+    running = {}
+    reaped = {}
+    done = []
+
+    def reply(record):
+        with out_lock:
+            sys.stdout.write(json.dumps(record) + "\n")
+            sys.stdout.flush()
+
+    def finished(ident, proc, status, ru):
+        # Tell Popen it has been reaped.
+        proc.returncode = _exitcode(status)
+        reply({"id": ident, "returncode": proc.returncode, "rusage": _rusage(ru)})
+
+    def reap():
+        # One thread waits for every job.
+        while True:
+            with cond:
+                while not running and not done:
+                    cond.wait()
+                if not running:
+                    return
+            try:
+                pid, status, ru = os.wait4(-1, 0)
+            except ChildProcessError:
+                continue
+            with cond:
+                job = running.pop(pid, None)
+                if job is None:
+                    reaped[pid] = (status, ru)
+            if job is not None:
+                finished(job[0], job[1], status, ru)
+
+    reaper = threading.Thread(target=reap)
+    reaper.start()
+    for line in sys.stdin:
+        request = json.loads(line)
+        setup = None
+        if "setup" in request:
+            setup = ChildSetup(**request["setup"])
+        try:
+            proc = _popen(request["args"], request["cwd"], request["log"], setup)
+        except (OSError, ValueError, subprocess.SubprocessError) as exc:
+            reply({"id": request["id"], "error": str(exc)})
+            continue
+        reply({"id": request["id"], "pid": proc.pid})
+        with cond:
+            early = reaped.pop(proc.pid, None)
+            if early is None:
+                running[proc.pid] = (request["id"], proc)
+                cond.notify()
+        if early is not None:
+            finished(request["id"], proc, *early)
+    # pyslice closed the pipe, report on the jobs still running and quit.
+    with cond:
+        done.append(True)
+        cond.notify()
+    reaper.join()
+
+
+def make_launcher(name):
+    """Returns a launcher, falling back to 'popen' where 'name' can't work."""
+    # posix_spawn sets the limits of the new process with prlimit, which
+    # only Linux has.
+    if (
+        name == "posix_spawn"
+        and hasattr(os, "posix_spawn")
+        and hasattr(resource, "prlimit")
+    ):
+        return PosixSpawnLauncher()
+    if name == "forkserver" and os.name != "nt":
+        return ForkServerLauncher()
+    return PopenLauncher()
+
+
+class LaunchStats(object):
+    """Collects how long it takes to get each model process started."""
+
+    def __init__(self):
+        self.latencies = []
+
+    def record(self, seconds):
+        # list.append is atomic, no lock needed between job threads.
+        self.latencies.append(seconds)
+
+    def summary(self):
+        if not self.latencies:
+            return ""
+        lat = sorted(self.latencies)
+
+        def percentile(fraction):
+            return 1000.0 * lat[min(len(lat) - 1, int(fraction * len(lat)))]
+
+        return (
+            "Launched %d processes, launch latency (ms): min %.2f, median %.2f, "
+            "p90 %.2f, p99 %.2f, max %.2f\n"
+            % (
+                len(lat),
+                1000.0 * lat[0],
+                percentile(0.5),
+                percentile(0.9),
+                percentile(0.99),
+                1000.0 * lat[-1],
+            )
+        )
+
+
+if __name__ == "__main__":
+    serve()
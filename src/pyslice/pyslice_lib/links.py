@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+"""
+Put binary template files into the output directories.
+
+Binary files are not rendered, so every output directory can get the same
+bytes without copying them.  How is chosen with 'link_binaries' in the
+[flags] section of pyslice.ini, either one strategy for every binary file
+or a dictionary of glob patterns, matched in order against the path
+relative to template_path the same way as the globs of 'exclude_copy', and
+their strategies:
+
+    copy      a copy of the file.  The default.
+    reflink   a copy on write clone (the FICLONE ioctl) that shares the
+              blocks of the template file until either is changed, on
+              filesystems that have them (btrfs, XFS).
+    hardlink  another name for the template file.  A model that changes the
+              file in place changes the template and every other output
+              directory.
+    symlink   a symbolic link to the template file, with the same caveat.
+    auto      a reflink where the filesystem can make one, otherwise a copy.
+
+A strategy the filesystem doesn't support, for example a hard link to
+another filesystem, falls back to a copy, and isn't tried again.
+"""
+
+from __future__ import absolute_import, print_function
+
+import errno
+import filecmp
+import os
+import re
+import shutil
+import stat
+import threading
+
+try:
+    import fcntl
+except ImportError:
+    # Windows
+    fcntl = None
+
+from pyslice.pyslice_lib.template import glob_regex
+from pyslice.pyslice_lib.writer import TMP_SUFFIX
+
+STRATEGIES = ["copy", "reflink", "hardlink", "symlink", "auto"]
+
+# From linux/fs.h
+FICLONE = 0x40049409
+
+
+def copy(src, dest):
+    """Copies src to dest unless it is already there, returns bytes written."""
+    try:
+        if filecmp.cmp(src, dest):
+            return 0
+    except OSError:
+        pass
+    tmp = dest + TMP_SUFFIX
+    shutil.copy(src, tmp)
+    os.replace(tmp, dest)
+    return os.path.getsize(dest)
+
+
+def reflink(src, dest):
+    if fcntl is None:
+        raise OSError(errno.EOPNOTSUPP, "reflinks are not supported")
+    tmp = dest + TMP_SUFFIX
+    try:
+        with open(src, "rb") as fsrc, open(tmp, "wb") as fdst:
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+        shutil.copymode(src, tmp)
+        os.replace(tmp, dest)
+    except OSError:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+
+
+def parse_rules(value):
+    """Returns the [(pattern, strategy)] of the 'link_binaries' flag."""
+    value = value.strip()
+    if value[:1] == "{":
+        rules = list(eval(value).items())
+    else:
+        rules = [("*", value.strip("'\""))]
+    return rules
+
+
+def pattern_regex(pattern):
+    """Compiles a 'link_binaries' glob.
+
+    '*' and '?' don't match '/' and '**' matches anything.  A pattern
+    without a '/' matches the file name in any directory.
+
+    """
+    if "/" in pattern:
+        return re.compile("^" + glob_regex(pattern.lstrip("/")) + "$")
+    return re.compile("(?:^|/)" + glob_regex(pattern) + "$")
+
+
+class Linker(object):
+    def __init__(self, rules=()):
+        self.rules = list(rules)
+        self.compiled = [
+            (pattern_regex(pattern), strategy) for pattern, strategy in self.rules
+        ]
+        # Files can be placed from more than one thread.
+        self.lock = threading.Lock()
+        self.unsupported = set()
+        # strategy -> number of files placed with it
+        self.counts = {}
+        # Bytes that were linked instead of written
+        self.saved = 0
+
+    def strategy(self, rel_path):
+        """The strategy of the first rule matching rel_path."""
+        path = rel_path.replace(os.sep, "/")
+        for regex, strategy in self.compiled:
+            if regex.search(path):
+                return strategy
+        return "copy"
+
+    def place(self, src, dest, rel_path):
+        """Puts the template file src at dest, returns the bytes written."""
+        strategy = self.strategy(rel_path)
+        if strategy == "auto":
+            strategy = "reflink"
+        try:
+            dest_stat = os.lstat(dest)
+        except OSError:
+            dest_stat = None
+        if dest_stat is not None:
+            # A link left by an earlier run is kept if it is still wanted,
+            # otherwise removed so that it isn't taken for a copy.
+            if stat.S_ISLNK(dest_stat.st_mode):
+                if strategy == "symlink" and os.readlink(dest) == src:
+                    return 0
+                os.unlink(dest)
+            elif os.path.samestat(dest_stat, os.stat(src)):
+                if strategy == "hardlink":
+                    return 0
+                os.unlink(dest)
+            elif strategy in ("hardlink", "symlink"):
+                os.unlink(dest)
+        if strategy != "copy" and strategy not in self.unsupported:
+            try:
+                if strategy == "reflink":
+                    reflink(src, dest)
+                elif strategy == "hardlink":
+                    os.link(src, dest)
+                else:
+                    os.symlink(src, dest)
+            except OSError as exc:
+                # Too many links to this one file doesn't say anything
+                # about the others.
+                if exc.errno != errno.EMLINK:
+                    self.unsupported.add(strategy)
+            else:
+                size = os.path.getsize(src)
+                with self.lock:
+                    self.counts[strategy] = self.counts.get(strategy, 0) + 1
+                    self.saved += size
+                return 0
+        with self.lock:
+            self.counts["copy"] = self.counts.get("copy", 0) + 1
+        return copy(src, dest)
+
+    def summary(self):
+        if not self.counts:
+            return ""
+        placed = ", ".join(
+            "%d %s" % (self.counts[i], {"copy": "copied"}.get(i, i + "ed"))
+            for i in STRATEGIES
+            if i in self.counts
+        )
+        if self.saved:
+            placed += ", %.1f MB not written" % (self.saved / 1048576.0)
+        return "Binary files: %s\n" % placed
@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+"""
+Remember what was rendered so a rerun only renders what changed.
+
+The manifest is pickled to 'pyslice_rendered.pickle' in the output directory.
+For every file rendered into an output directory it keeps the signature of
+its template (template.TemplateFile.signature), the values of the variables
+the template refers to, the size and modification time the file was left
+with and a hash of what was written.  On a rerun a file is rendered again
+only when
+
+    the template, or the template strings it uses, changed
+    one of the variables the template refers to has a different value
+    the output file is missing or was changed since it was written
+
+and even then it is only written when the hash of the new text differs, so
+that files that come out the same keep their modification times.  Binary
+files are copied again only when the template file is not the same file,
+by size, modification time and inode, or the copy was changed.
+
+Directory names are kept too, so that extending a sweep with more values
+only adds directories: flat directories keep their numbers, new
+permutations are numbered after them, and the zero padding of the variable
+values in nested directory names stays what it was.  Montecarlo samples are
+kept by their number instead of their value, so new samples drawn on a rerun
+go to the directories of the old ones.
+"""
+
+from __future__ import absolute_import, print_function
+
+import os
+import pickle
+import tempfile
+
+FORMAT = 3
+
+MANIFEST_FILE = "pyslice_rendered.pickle"
+
+
+def values_key(var_set):
+    """The variable values of an nset entry, as a key that tells 5 from 5.0."""
+    return tuple((name, repr(value)) for name, value in var_set[1:])
+
+
+class RenderManifest(object):
+    def __init__(self, path):
+        self.path = path
+        # Zero padding of the integer variables in nested directory names
+        self.widths = {}
+        # values_key -> flat directory name, and the width of the numbers
+        self.flat = {}
+        self.flat_width = None
+        # directory -> {rel_path: (signature, refs, size, mtime, sha256)}
+        self.dirs = {}
+
+    @classmethod
+    def load(cls, path):
+        """Returns the manifest at path, or an empty one."""
+        manifest = cls(path)
+        try:
+            with open(path, "rb") as fpi:
+                saved = pickle.load(fpi)
+        except Exception:
+            # Missing, truncated or written by an incompatible version.
+            return manifest
+        if not isinstance(saved, dict) or saved.get("format") != FORMAT:
+            return manifest
+        manifest.widths = saved["widths"]
+        manifest.flat = saved["flat"]
+        manifest.flat_width = saved["flat_width"]
+        manifest.dirs = saved["dirs"]
+        return manifest
+
+    def save(self):
+        # Each save goes through its own temporary file, so that runs saving
+        # at the same time can't mix their writes.
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=directory, prefix=MANIFEST_FILE, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as fpo:
+                pickle.dump(
+                    {
+                        "format": FORMAT,
+                        "widths": self.widths,
+                        "flat": self.flat,
+                        "flat_width": self.flat_width,
+                        "dirs": self.dirs,
+                    },
+                    fpo,
+                    protocol=pickle.HIGHEST_PROTOCOL,
+                )
+            os.replace(tmp, self.path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            raise
+
+    def flat_names(self, nset, samples=(), sizes=()):
+        """Names the flat directories, keeping the names already given.
+
+        'samples' are the montecarlo variables and 'sizes' the (name,
+        number of values) of every variable, in the order of nset.  A
+        sample is kept by where it comes among the values of its variable.
+
+        """
+        if self.flat_width is None:
+            self.flat_width = len(str(len(nset)))
+        used = [int(name) for name in self.flat.values()]
+        number = max(used) if used else 0
+        # name -> (permutations per value, number of values), the last
+        # variable changing fastest
+        strides = {}
+        stride = 1
+        for name, size in reversed(list(sizes)):
+            if name in samples:
+                strides[name] = (stride, size)
+            stride *= size
+        names = []
+        for perm_id, var_set in enumerate(nset):
+            key = values_key(var_set)
+            if strides:
+                key = list(key)
+                for index, (name, _) in enumerate(key):
+                    if name in strides:
+                        stride, size = strides[name]
+                        key[index] = (name, "#%d" % (perm_id // stride % size))
+                key = tuple(key)
+            name = self.flat.get(key)
+            if name is None:
+                number += 1
+                name = str(number).zfill(self.flat_width)
+                self.flat[key] = name
+            names.append(name)
+        return names
+
+    def width(self, name, width):
+        """The zero padding of variable 'name', fixed when first used."""
+        return self.widths.setdefault(name, width)
+
+    def up_to_date(self, directory, rel_path, signature, refs, outfilepath):
+        """Is the file at outfilepath what rendering would write again?
+
+        'refs' are the (variable, repr(value)) the template refers to.
+
+        """
+        state = self.dirs.get(directory, {}).get(rel_path)
+        if state is None or state[:2] != (signature, refs):
+            return False
+        return self.unchanged(state, outfilepath)
+
+    def same_content(self, directory, rel_path, content, outfilepath):
+        """Does outfilepath already hold text with the hash 'content'?"""
+        state = self.dirs.get(directory, {}).get(rel_path)
+        if state is None or state[4] != content:
+            return False
+        return self.unchanged(state, outfilepath)
+
+    def unchanged(self, state, outfilepath):
+        try:
+            stat = os.stat(outfilepath)
+        except OSError:
+            return False
+        return (stat.st_size, stat.st_mtime_ns) == state[2:4]
+
+    def record(self, directory, rel_path, signature, refs, outfilepath, content=None):
+        """Notes that outfilepath was rendered, written or not."""
+        stat = os.stat(outfilepath)
+        self.dirs.setdefault(directory, {})[rel_path] = (
+            signature,
+            refs,
+            stat.st_size,
+            stat.st_mtime_ns,
+            content,
+        )
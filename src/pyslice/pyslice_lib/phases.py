@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+"""
+Named phases of a pyslice run, for profiling pyslice itself.
+
+The run is marked into phases: 'config', 'compile', 'enumerate', 'schedule',
+'render' (with 'substitute' and 'copy' inside it), 'dispatch wait',
+'launch', 'drain' (waiting for the last runs) and 'results'.
+Functions added with add_hook() are called with the name of the phase and
+'begin' or 'end' around every phase, in the thread running it, so that
+other profilers can be switched on and off by phase.
+
+With the 'time' profiler the time and number of calls of each phase are
+collected, 'cpu' runs cProfile over the main thread and 'memory' traces
+allocations with tracemalloc.  report() writes what was collected to
+'pyslice_profile.txt', and the cProfile statistics to 'pyslice_profile.prof'.
+"""
+
+from __future__ import absolute_import, print_function
+
+import os
+import threading
+import time
+
+PROFILERS = ["time", "cpu", "memory"]
+
+HOOKS = []
+
+
+def add_hook(hook):
+    """Calls hook(name, event) at the 'begin' and 'end' of every phase."""
+    HOOKS.append(hook)
+
+
+def remove_hook(hook):
+    HOOKS.remove(hook)
+
+
+class _NoPhase(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NO_PHASE = _NoPhase()
+
+
+class _Phase(object):
+    def __init__(self, phases, name):
+        self.phases = phases
+        self.name = name
+
+    def __enter__(self):
+        for hook in HOOKS:
+            hook(self.name, "begin")
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.start
+        if self.phases.timing:
+            self.phases.add(self.name, elapsed)
+        for hook in HOOKS:
+            hook(self.name, "end")
+        return False
+
+
+class Phases(object):
+    def __init__(self, profilers=()):
+        for name in profilers:
+            if name not in PROFILERS:
+                raise ValueError(
+                    "'%s' is not a valid profiler - %s" % (name, PROFILERS)
+                )
+        self.profilers = list(profilers)
+        self.timing = bool(self.profilers)
+        self.lock = threading.Lock()
+        # name -> [calls, seconds]
+        self.totals = {}
+        self.cpu = None
+        self.start_time = None
+        self.stop_time = None
+
+    def phase(self, name):
+        """Context manager marking the phase 'name'."""
+        if not self.timing and not HOOKS:
+            return _NO_PHASE
+        return _Phase(self, name)
+
+    def begin(self, name):
+        """Starts the phase 'name' for code that can't be in a with block.
+
+        Returns what to hand to end().
+
+        """
+        phase = self.phase(name)
+        phase.__enter__()
+        return phase
+
+    def end(self, phase):
+        phase.__exit__(None, None, None)
+
+    def add(self, name, elapsed):
+        with self.lock:
+            total = self.totals.setdefault(name, [0, 0.0])
+            total[0] += 1
+            total[1] += elapsed
+
+    def start(self):
+        """Starts the profilers."""
+        self.start_time = time.perf_counter()
+        if "memory" in self.profilers:
+            import tracemalloc
+
+            tracemalloc.start(10)
+        if "cpu" in self.profilers:
+            import cProfile
+
+            self.cpu = cProfile.Profile()
+            self.cpu.enable()
+
+    def stop(self):
+        self.stop_time = time.perf_counter()
+        if self.cpu is not None:
+            self.cpu.disable()
+
+    def report(self, path, top=20):
+        """Writes the profile to 'path'/pyslice_profile.txt.
+
+        Returns the name of the file, or None if no profiler was on.
+
+        """
+        if not self.timing:
+            return None
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        run_time = (self.stop_time or time.perf_counter()) - self.start_time
+        lines = [
+            "pyslice run: %.3f s" % run_time,
+            "",
+            "{:<16}{:>10}{:>12}{:>12}{:>8}".format(
+                "phase", "calls", "total (s)", "mean (ms)", "% run"
+            ),
+        ]
+        for name, (calls, seconds) in sorted(
+            self.totals.items(), key=lambda i: -i[1][1]
+        ):
+            lines.append(
+                "{:<16}{:>10}{:>12.3f}{:>12.3f}{:>8.1f}".format(
+                    name,
+                    calls,
+                    seconds,
+                    1000.0 * seconds / calls,
+                    100.0 * seconds / run_time if run_time else 0.0,
+                )
+            )
+        lines.append(
+            "Phases in job threads ('launch') overlap and can add up to more "
+            "than the run."
+        )
+        if "memory" in self.profilers:
+            import tracemalloc
+
+            current, peak = tracemalloc.get_traced_memory()
+            snapshot = tracemalloc.take_snapshot()
+            tracemalloc.stop()
+            lines.extend(
+                [
+                    "",
+                    "Traced memory (MB): current %.1f, peak %.1f"
+                    % (current / 1048576.0, peak / 1048576.0),
+                    "Top %d allocators:" % top,
+                ]
+            )
+            for stat in snapshot.statistics("lineno")[:top]:
+                lines.append("    %s" % stat)
+        if self.cpu is not None:
+            import io
+            import pstats
+
+            self.cpu.dump_stats(os.path.join(path, "pyslice_profile.prof"))
+            out = io.StringIO()
+            stats = pstats.Stats(self.cpu, stream=out)
+            stats.sort_stats("cumulative").print_stats(top)
+            lines.extend(["", "cProfile of the main thread, by cumulative time:"])
+            lines.append(out.getvalue())
+        report_file = os.path.join(path, "pyslice_profile.txt")
+        with open(report_file, "w") as fpo:
+            fpo.write("\n".join(lines) + "\n")
+        return report_file
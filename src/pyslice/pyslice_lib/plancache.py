@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+"""
+Keep the compiled plan of a sweep between runs.
+
+The plan is everything pyslice works out before it renders the first
+permutation: the values of the variables, the permutations, and the
+compiled template Manifest.  It is pickled to 'pyslice_plan.pickle' in the
+output directory together with what it was built from:
+
+    key      the pyslice and Python versions, the working directory and a
+             hash of pyslice.ini
+    files    the modification time, size and hash of every template file
+             and template strings file
+    dirs     the modification time of every template directory, which
+             changes when a file is added, removed or renamed
+
+The cache is used when the key matches, every directory is unchanged and
+every file has the same modification time and size, or failing that the
+same hash.  Checking costs a stat per file, so a run over an unchanged
+sweep starts without parsing or compiling anything.
+"""
+
+from __future__ import absolute_import, print_function
+
+import hashlib
+import os
+import pickle
+import sys
+import tempfile
+
+FORMAT = 5
+
+CACHE_FILE = "pyslice_plan.pickle"
+
+
+def digest(path):
+    sha = hashlib.sha256()
+    with open(path, "rb") as fpi:
+        for chunk in iter(lambda: fpi.read(1 << 20), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def make_key(ini_path, version):
+    return (
+        FORMAT,
+        version,
+        sys.version,
+        os.getcwd(),
+        os.path.abspath(ini_path),
+        digest(ini_path),
+    )
+
+
+def load(cache_path, key):
+    """Returns the cached plan, or None if there is none or it is stale."""
+    try:
+        with open(cache_path, "rb") as fpi:
+            cached = pickle.load(fpi)
+    except Exception:
+        # Missing, truncated or written by an incompatible version.
+        return None
+    if not isinstance(cached, dict) or cached.get("key") != key:
+        return None
+    try:
+        for path, mtime in cached["dirs"].items():
+            if os.stat(path).st_mtime_ns != mtime:
+                return None
+        for path, (mtime, size, sha) in cached["files"].items():
+            stat = os.stat(path)
+            if stat.st_size != size:
+                return None
+            if stat.st_mtime_ns != mtime and digest(path) != sha:
+                return None
+    except OSError:
+        return None
+    return cached["plan"]
+
+
+def save(cache_path, key, plan, files, dirs):
+    """Pickles 'plan' with the state of the files and dirs it was built from."""
+    cached = {
+        "key": key,
+        "plan": plan,
+        "files": {},
+        "dirs": {},
+    }
+    for path in dirs:
+        cached["dirs"][path] = os.stat(path).st_mtime_ns
+    for path in files:
+        stat = os.stat(path)
+        cached["files"][path] = (stat.st_mtime_ns, stat.st_size, digest(path))
+    # Jobs of a task array can save at the same time, each through its own
+    # temporary file, and the last rename wins.
+    directory = os.path.dirname(os.path.abspath(cache_path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix=CACHE_FILE, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as fpo:
+            pickle.dump(cached, fpo, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, cache_path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
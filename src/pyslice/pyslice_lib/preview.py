@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+"""
+Size up a sweep before any permutation is generated.
+
+The number of permutations is the product of the number of values of each
+variable, which PySPG works out per variable when the parser is built, so
+nothing is enumerated.  The disk space and inodes the output directories
+will take are estimated from the size of the template Manifest.
+"""
+
+from __future__ import absolute_import, print_function
+
+
+def axis_sizes(pyspg_obj):
+    """Returns (name, number of values) of each variable of a ParamParser."""
+    return [(i.get_varname(), len(i.data)) for i in pyspg_obj.variables_list]
+
+
+def count(sizes):
+    total = 1
+    for _, size in sizes:
+        total *= size
+    return total
+
+
+def directories(sizes, flat_dirs):
+    """Number of directories made to hold the permutations.
+
+    Flat directories are one per permutation, otherwise there is a level
+    for each variable and every level has a directory for every
+    combination of the values above it.
+
+    """
+    if flat_dirs:
+        return count(sizes)
+    total = 0
+    level = 1
+    for _, size in sizes:
+        level *= size
+        total += level
+    return total
+
+
+def human(size):
+    for unit in ["B", "KB", "MB", "GB", "TB"]:
+        if size < 1024 or unit == "TB":
+            return "%.1f %s" % (size, unit)
+        size /= 1024.0
+
+
+def summary(sizes, template, flat_dirs, keep_log=False, directories_made=True):
+    """The preview printed before asking whether to continue.
+
+    'template' is the bytes, files and sub-directories of the template, as
+    returned by template.Manifest.usage().
+
+    """
+    total = count(sizes)
+    lines = [
+        "Variables: " + ", ".join("%s (%d)" % (name, size) for name, size in sizes),
+        "Permutations: %d" % total,
+    ]
+    if directories_made:
+        size, files, dirs = template
+        inodes = directories(sizes, flat_dirs) + total * (
+            files + dirs + (1 if keep_log else 0)
+        )
+        lines.extend(
+            [
+                "Estimated disk use: %s (%s of template for each permutation)"
+                % (human(size * total), human(size)),
+                "Estimated inodes: %d" % inodes,
+            ]
+        )
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+"""
+Report how far a sweep has got while it runs.
+
+Progress counts permutations: how many directories have been rendered, and
+how many are queued, running, completed or failed.  The throughput is a
+moving average over the recently finished permutations and gives the
+estimated time to go.
+
+The job threads only bump counters under a lock.  A reporter thread wakes
+every 'interval' seconds to print a progress line and rewrite the status
+file, so reporting costs the same however fast the jobs finish.  The status
+file is written to a temporary file that is renamed over the old one, so a
+reader never sees half of it.  Optionally the same JSON is served on
+http://127.0.0.1:<port>/.
+"""
+
+from __future__ import absolute_import, print_function
+
+import collections
+import json
+import os
+import sys
+import threading
+import time
+
+# Batch status words that count as completed.
+OK_STATUSES = ("ok", "success")
+
+
+class Progress(object):
+    # Number of finished permutations the throughput is averaged over.
+    window = 100
+
+    def __init__(self, total, status_path=None, interval=2.0, port=None):
+        self.total = total
+        self.status_path = status_path
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.counts = {
+            "rendered": 0,
+            "queued": 0,
+            "running": 0,
+            "completed": 0,
+            "failed": 0,
+        }
+        self.start = time.time()
+        # (time, number of permutations) of the most recent finishes
+        self.finishes = collections.deque(maxlen=self.window)
+        self.stopped = threading.Event()
+        self.reporter = None
+        self.server = None
+        if port is not None:
+            self.serve(port)
+
+    def rendered(self, count=1):
+        with self.lock:
+            self.counts["rendered"] += count
+
+    def queued(self, count=1):
+        with self.lock:
+            self.counts["queued"] += count
+
+    def started(self, count=1):
+        with self.lock:
+            self.counts["queued"] -= count
+            self.counts["running"] += count
+
+    def finished(self, completed=1, failed=0, was="running"):
+        """Counts permutations that were 'running' (or 'queued') as done."""
+        with self.lock:
+            self.counts[was] -= completed + failed
+            self.counts["completed"] += completed
+            self.counts["failed"] += failed
+            self.finishes.append((time.time(), completed + failed))
+
+    def throughput(self):
+        """Permutations finished per second, averaged over the recent ones."""
+        with self.lock:
+            finishes = list(self.finishes)
+        if not finishes:
+            return 0.0
+        if len(finishes) < self.window:
+            # Not enough yet to leave out the start of the run.
+            since = self.start
+            done = sum(count for _, count in finishes)
+        else:
+            since = finishes[0][0]
+            done = sum(count for _, count in finishes[1:])
+        elapsed = finishes[-1][0] - since
+        if elapsed <= 0:
+            return 0.0
+        return done / elapsed
+
+    def snapshot(self):
+        rate = self.throughput()
+        with self.lock:
+            status = dict(self.counts)
+        done = status["completed"] + status["failed"]
+        status["total"] = self.total
+        status["elapsed"] = time.time() - self.start
+        status["throughput"] = rate
+        status["eta"] = None
+        if rate > 0:
+            status["eta"] = (self.total - done) / rate
+        return status
+
+    def line(self, status):
+        eta = "--:--:--"
+        if status["eta"] is not None:
+            eta = time.strftime("%H:%M:%S", time.gmtime(status["eta"]))
+        return (
+            (
+                "%(completed)d/%(total)d done, %(failed)d failed, %(running)d "
+                "running, %(queued)d queued, %(rendered)d rendered, "
+                "%(throughput).2f/s" % status
+            )
+            + ", ETA "
+            + eta
+        )
+
+    def report(self, end="\r"):
+        status = self.snapshot()
+        if self.status_path is not None:
+            tmp = self.status_path + ".tmp"
+            with open(tmp, "w") as fpo:
+                json.dump(status, fpo)
+            os.replace(tmp, self.status_path)
+        if sys.stderr.isatty() or end != "\r":
+            sys.stderr.write(self.line(status) + end)
+            sys.stderr.flush()
+
+    def _report_loop(self):
+        while not self.stopped.wait(self.interval):
+            self.report()
+
+    def begin(self):
+        """Starts reporting every 'interval' seconds."""
+        self.start = time.time()
+        self.reporter = threading.Thread(target=self._report_loop)
+        self.reporter.daemon = True
+        self.reporter.start()
+
+    def stop(self):
+        """Stops reporting and writes the final status."""
+        self.stopped.set()
+        if self.reporter is not None:
+            self.reporter.join()
+        self.report(end="\n")
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+
+    def serve(self, port):
+        """Serves the status as JSON on localhost 'port'."""
+        from http.server import BaseHTTPRequestHandler, HTTPServer
+
+        progress = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = json.dumps(progress.snapshot()).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = HTTPServer(("127.0.0.1", port), Handler)
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
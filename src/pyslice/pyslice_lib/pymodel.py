@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+"""
+Run a Python function as the model instead of an external program.
+
+The function is named in pyslice.ini as 'package.module:function' and is
+called in a pool of worker processes that live for the whole sweep, so the
+interpreter start up and the imports are paid once per worker instead of once
+per permutation.
+"""
+
+from __future__ import absolute_import, print_function
+
+import contextlib
+import importlib
+import json
+import os
+import sys
+
+# Functions already imported in this process, keyed by their
+# 'package.module:function' specification.
+_callables = {}
+
+
+def load_callable(spec):
+    """Import and return the function named by 'package.module:function'."""
+    try:
+        return _callables[spec]
+    except KeyError:
+        pass
+    modname, sep, funcname = spec.partition(":")
+    if not sep or not modname or not funcname:
+        raise ValueError(
+            "callable must be given as 'package.module:function', not '%s'" % spec
+        )
+    func = importlib.import_module(modname.strip())
+    for attr in funcname.strip().split("."):
+        func = getattr(func, attr)
+    _callables[spec] = func
+    return func
+
+
+def init_worker(base_dir):
+    """Initializer for the worker processes.
+
+    Modules that sit next to pyslice.ini are importable in the workers, the
+    same as they are when pyslice is started from that directory.
+
+    """
+    if base_dir not in sys.path:
+        sys.path.insert(0, base_dir)
+    # Same flag that external programs see.
+    os.environ["PYSLICE"] = "1"
+
+
+@contextlib.contextmanager
+def worker_state(base_dir):
+    """init_worker for the current process, undone on the way out."""
+    inserted = base_dir not in sys.path
+    flag = os.environ.get("PYSLICE")
+    init_worker(base_dir)
+    try:
+        yield
+    finally:
+        if inserted and base_dir in sys.path:
+            sys.path.remove(base_dir)
+        if flag is None:
+            os.environ.pop("PYSLICE", None)
+        else:
+            os.environ["PYSLICE"] = flag
+
+
+def call_model(spec, variables, directory, base_dir=None):
+    """Call the model function for one permutation in 'directory'.
+
+    With 'base_dir' the worker is first set up with init_worker, for
+    executors that weren't started with it.
+
+    """
+    if base_dir is not None:
+        init_worker(base_dir)
+    func = load_callable(spec)
+    os.chdir(directory)
+    return func(variables, directory)
+
+
+def write_results(path, jobs):
+    """Write one JSON line per job, in permutation order.
+
+    'jobs' is a list of (permutation, directory, variables, future) in any
+    order.  Results that JSON cannot represent are written with repr().
+
+    """
+    with open(path, "w") as fpo:
+        for _, directory, variables, future in sorted(jobs, key=lambda i: i[0]):
+            record = {"directory": directory, "variables": variables}
+            try:
+                record["result"] = future.result()
+            except Exception as exc:
+                record["error"] = repr(exc)
+            fpo.write(json.dumps(record, default=repr) + "\n")
+
+
+def make_block(axes, start, stop):
+    """Build the block of permutations start to stop as NumPy arrays.
+
+    'axes' are the (variable, values) of Plan.axis_values.  The values of
+    each permutation are found from its number, so nothing has to be
+    enumerated.  The block has one array per variable plus a 'permutation'
+    array with the permutation numbers.
+
+    """
+    import numpy
+
+    permutation = numpy.arange(start, stop)
+    block = {"permutation": permutation}
+    if not axes:
+        return block
+    indices = numpy.unravel_index(permutation, [len(values) for _, values in axes])
+    for (vname, values), index in zip(axes, indices):
+        block[vname] = numpy.asarray(values)[index]
+    return block
+
+
+def call_model_block(spec, block):
+    """Call the model function on a whole block of permutations.
+
+    The function gets the block and returns either a dictionary of arrays or
+    a single array, which is stored as the 'result' column.  Every returned
+    array must have one entry per permutation in the block.
+
+    """
+    import numpy
+
+    func = load_callable(spec)
+    results = func(block)
+    if not isinstance(results, dict):
+        results = {"result": results}
+    nrows = len(block["permutation"])
+    out = {}
+    for name, values in results.items():
+        if name in block:
+            raise ValueError(
+                "result column '%s' has the same name as a variable" % name
+            )
+        values = numpy.asarray(values)
+        if values.ndim == 0 or len(values) != nrows:
+            raise ValueError(
+                "result column '%s' must have %d rows, one per permutation"
+                % (name, nrows)
+            )
+        out[name] = values
+    return out
+
+
+def write_block_results(path, blocks):
+    """Store the variables and the results of all blocks column by column.
+
+    'blocks' is a list of (block, future).  The columns are concatenated in
+    permutation order and saved with numpy.savez.  A block that failed is
+    reported and left out, which shows as missing numbers in the
+    'permutation' column.  Returns the number of failed blocks.
+
+    """
+    import numpy
+
+    columns = {}
+    failed = 0
+    for block, future in blocks:
+        try:
+            results = future.result()
+        except Exception as exc:
+            failed += 1
+            sys.stdout.write(
+                "Block of permutations %d to %d failed: %r\n"
+                % (block["permutation"][0], block["permutation"][-1], exc)
+            )
+            continue
+        for name, values in list(block.items()) + list(results.items()):
+            columns.setdefault(name, []).append(values)
+    numpy.savez(path, **{name: numpy.concatenate(v) for name, v in columns.items()})
+    return failed
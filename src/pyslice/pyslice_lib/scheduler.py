@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+"""
+Decide when the next job may start.
+
+A job is admitted when one of the 'max_threads' slots is free and the machine
+can take it: the available memory less the memory promised to recently
+started jobs must still cover the job's memory estimate plus
+'memory_reserve', and the load average must be below 'max_load'.  Jobs that
+can't be admitted wait, they are never started on an overcommitted machine.
+To always make progress a job is admitted whenever nothing else is running.
+
+The order the jobs are started in can also be chosen.  'longest_first' starts
+the jobs expected to run longest first so the sweep doesn't end with a long
+tail of a few slow jobs.
+"""
+
+from __future__ import absolute_import, print_function
+
+import json
+import os
+import threading
+import time
+
+MB = 1024 * 1024
+
+
+def mem_available():
+    """Returns the available memory in bytes, or None if it can't be read."""
+    try:
+        with open("/proc/meminfo", "r") as fpi:
+            for line in fpi:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except (IOError, OSError, ValueError):
+        pass
+    return None
+
+
+def load_average():
+    """Returns the one minute load average, or None if it can't be read."""
+    try:
+        return os.getloadavg()[0]
+    except (AttributeError, OSError):
+        return None
+
+
+class Scheduler(object):
+    """Hands out job slots subject to the memory and load limits.
+
+    There are 'max_jobs' slots, which are cores when jobs declare how many
+    cores they use; a job takes as many slots as it has cores.
+    'memory_reserve' and the memory estimates are in bytes.  A job started
+    less than 'settle_time' seconds ago may not have allocated its memory
+    yet, so its estimate is taken off the available memory.
+
+    """
+
+    poll_interval = 0.25
+
+    def __init__(self, max_jobs, memory_reserve=0, max_load=None, settle_time=5.0):
+        self.free_slots = list(range(max_jobs))
+        self.memory_reserve = memory_reserve
+        self.max_load = max_load
+        self.settle_time = settle_time
+        self.cond = threading.Condition()
+        # first slot -> (start time, memory estimate) of the running jobs
+        self.running = {}
+        self.waits = []
+
+    def _admit(self, memory, cores):
+        if len(self.free_slots) < cores:
+            return False
+        if not self.running:
+            return True
+        if self.max_load is not None:
+            load = load_average()
+            if load is not None and load >= self.max_load:
+                return False
+        available = mem_available()
+        if available is not None:
+            now = time.time()
+            settling = sum(
+                estimate
+                for started, estimate in self.running.values()
+                if now - started < self.settle_time
+            )
+            if available - settling - memory < self.memory_reserve:
+                return False
+        return True
+
+    def try_acquire(self, memory=0, cores=1, queued=None):
+        """Admits a job needing 'memory' bytes and 'cores' slots if it can.
+
+        Returns None if it can't, otherwise the list of slots and the seconds
+        since the job was 'queued'.
+
+        """
+        with self.cond:
+            if not self._admit(memory, cores):
+                return None
+            slots = self.free_slots[:cores]
+            del self.free_slots[:cores]
+            now = time.time()
+            self.running[slots[0]] = (now, memory)
+        waited = now - (queued or now)
+        self.waits.append(waited)
+        return slots, waited
+
+    def wait(self):
+        """Waits for a job to finish, or for conditions to change."""
+        with self.cond:
+            self.cond.wait(self.poll_interval)
+
+    def release(self, slots):
+        with self.cond:
+            del self.running[slots[0]]
+            self.free_slots.extend(slots)
+            self.free_slots.sort()
+            self.cond.notify_all()
+
+    def summary(self):
+        if not self.waits:
+            return ""
+        return "Waited for admission (s): mean %.2f, max %.2f, total %.1f\n" % (
+            sum(self.waits) / len(self.waits),
+            max(self.waits),
+            sum(self.waits),
+        )
+
+
+def cpu_sets(max_jobs):
+    """Splits the CPUs pyslice may use into one fixed set per job slot.
+
+    With more slots than CPUs the slots share the CPUs round robin.
+
+    """
+    try:
+        cpus = sorted(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = list(range(os.cpu_count() or 1))
+    per_slot = max(len(cpus) // max_jobs, 1)
+    return [
+        [cpus[(slot * per_slot + i) % len(cpus)] for i in range(per_slot)]
+        for slot in range(max_jobs)
+    ]
+
+
+ORDERS = ["odometer", "longest_first"]
+
+
+def runtime_key(variables):
+    """Key that identifies a permutation by its variable values."""
+    return json.dumps(variables, sort_keys=True)
+
+
+def learned_runtimes(job_log_path):
+    """Returns the last recorded wall time of each permutation.
+
+    Read from the 'pyslice_jobs.jsonl' of earlier runs.  Batch jobs, which
+    cover several permutations, and jobs that never started are skipped.
+
+    """
+    runtimes = {}
+    if not os.path.exists(job_log_path):
+        return runtimes
+    with open(job_log_path, "r") as fpi:
+        for line in fpi:
+            try:
+                job = json.loads(line)
+            except ValueError:
+                continue
+            if job.get("variables") is None or job.get("status") == "launch_error":
+                continue
+            runtimes[runtime_key(job["variables"])] = job["wall_time"]
+    return runtimes
+
+
+def longest_first(estimates):
+    """Returns the indices of 'estimates' from the largest estimate down.
+
+    Permutations without an estimate (None) are given the mean of the
+    others.  Ties keep their odometer order.
+
+    """
+    known = [i for i in estimates if i is not None]
+    default = sum(known) / len(known) if known else 0.0
+    estimates = [default if i is None else i for i in estimates]
+    return sorted(range(len(estimates)), key=lambda i: -estimates[i])
@@ -0,0 +1,408 @@
+# -*- coding: utf-8 -*-
+"""
+Compile the template directory once so each permutation only fills it in.
+
+What to do with each line of a template file doesn't depend on the
+permutation, so it is decided once here instead of for every permutation:
+each text file becomes a list of operations,
+
+    literal text      runs of lines without keywords, joined together
+    keyword line      a line with '$$...$$' expressions and the variables
+                      that appear in each of them
+    active comment    the comment line, the line template, with template
+                      strings already looked up, and the block of lines
+                      it overwrites
+
+and rendering a permutation replays them with its values, giving the
+output the line by line substitution always gave.  A file that
+can't be compiled (a malformed active comment, or a block running past the
+end of the file) keeps the reason, which is raised when it is rendered.
+
+The Manifest of the template directory, with the compiled files and whether
+each file is binary, can be pickled so it survives between runs.  Files and
+directories left out by the 'exclude_copy' rules aren't in it, and excluded
+directories aren't walked at all.
+"""
+
+from __future__ import absolute_import, print_function
+
+import hashlib
+import os
+import re
+import string
+
+LITERAL = 0
+KEYWORD = 1
+ACTIVE = 2
+
+LINEENDS = "\r\n"
+
+
+class NotCompilable(Exception):
+    pass
+
+
+def read_template_strings(filename):
+    """Reads a template strings file into {record number: template}."""
+    records = {}
+    with open(filename, "r") as lout:
+        for line in lout:
+            # Handle comments and blank lines
+            if "#" == line[0]:
+                continue
+            recno, sep, stemplate = line.partition("|")
+            if not stemplate:
+                continue
+            records[recno] = stemplate.rstrip(LINEENDS)
+    return records
+
+
+class CompiledTemplate(object):
+    def __init__(self, ops):
+        self.ops = ops
+        # The variables the output depends on, and a hash of everything
+        # else it depends on.
+        names = set()
+        sha = hashlib.sha256()
+        for op in ops:
+            if op[0] == LITERAL:
+                sha.update(repr((LITERAL, op[1])).encode("utf-8"))
+            elif op[0] == KEYWORD:
+                for _, _, sub_names in op[2]:
+                    names.update(sub_names)
+                sha.update(
+                    repr((KEYWORD, op[1], [i[0] for i in op[2]])).encode("utf-8")
+                )
+            else:
+                for _, field, _, _ in string.Formatter().parse(op[1]):
+                    if field:
+                        names.add(re.split(r"[.\[]", field)[0])
+                sha.update(repr(op).encode("utf-8"))
+        self.names = sorted(names)
+        self.signature = sha.hexdigest()
+
+    def render(self, var_dict, eval_globals):
+        """Returns the file for the variable values in var_dict.
+
+        Expressions are evaluated in 'eval_globals' with the variables as
+        locals.
+
+        """
+        local_vars = dict(var_dict)
+        out = []
+        for op in self.ops:
+            kind = op[0]
+            if kind == LITERAL:
+                out.append(op[1])
+            elif kind == KEYWORD:
+                matchline = op[1]
+                for matches, pattern, names in op[2]:
+                    for var_name in names:
+                        # replace variable name with number
+                        match = matches.replace(var_name, str(var_dict[var_name]))
+                        match = eval(match, eval_globals, local_vars)
+                        matchline = pattern.sub(str(match), matchline, count=1)
+                out.append(matchline)
+            else:
+                _, line_template, block = op
+                line_sub = line_template.format(**var_dict)
+                for linein in block:
+                    out.append(
+                        "".join(
+                            linein[index] if char == "*" else char
+                            for index, char in enumerate(line_sub)
+                        )
+                    )
+        return "".join(out)
+
+
+def compile_lines(
+    lines, code, keyword, variables, numargs=2, sources=None, base_path=None
+):
+    """Compiles the lines of a template file.
+
+    'code' is the active comment marker, 'variables' the variable names in
+    the order of the permutations.  Template strings files are found
+    relative to 'base_path', by default the current directory, and the ones
+    that are read are added to 'sources'.  Raises NotCompilable when the
+    file can't be rendered.
+
+    """
+    escaped_keyword = re.escape(keyword)
+    keyword_search = re.compile(escaped_keyword)
+    search_for = re.compile(escaped_keyword + "(.*?)" + escaped_keyword)
+    ops = []
+    literal = []
+
+    def flush():
+        if literal:
+            ops.append((LITERAL, "".join(literal)))
+            del literal[:]
+
+    index = 0
+    while index < len(lines):
+        line = lines[index]
+        index += 1
+        if code == line[: len(code)]:
+            literal.append(line)
+            words = line.split("|")
+            try:
+                if len(words) == 1:
+                    line_template = words[0]
+                    blocklen = 1
+                elif len(words) > numargs:
+                    line_template = "|".join(words[:-1])
+                    blocklen = int(words[-1])
+                else:
+                    line_template = words[0]
+                    blocklen = int(words[1])
+                line_template = line_template[len(code) :]
+                if "~" == line_template[1]:
+                    lookupno, filename = words[0].split()[1:3]
+                    lookupno = lookupno.split("~")[1]
+                    if base_path is not None:
+                        filename = os.path.join(base_path, filename)
+                    line_template = read_template_strings(filename)[lookupno]
+                    if sources is not None:
+                        sources.append(filename)
+            except (ValueError, IndexError, KeyError, IOError, OSError) as exc:
+                raise NotCompilable(str(exc))
+            block = lines[index : index + blocklen]
+            if len(block) < blocklen:
+                raise NotCompilable("active comment block runs past the end")
+            index += blocklen
+            flush()
+            ops.append((ACTIVE, line_template, block))
+        elif keyword_search.search(line):
+            flush()
+            subs = []
+            for matches in search_for.findall(line):
+                subs.append(
+                    (
+                        matches,
+                        re.compile(re.escape(keyword + matches + keyword)),
+                        [name for name in variables if name in matches],
+                    )
+                )
+            ops.append((KEYWORD, line, subs))
+        else:
+            literal.append(line)
+    flush()
+    try:
+        return CompiledTemplate(ops)
+    except ValueError as exc:
+        # A malformed '{}' field in an active comment
+        raise NotCompilable(str(exc))
+
+
+def glob_regex(pattern):
+    """Translates a glob pattern for a path with '/' separators to a regex.
+
+    '*' and '?' don't match '/', '**' matches anything.
+
+    """
+    out = []
+    index = 0
+    while index < len(pattern):
+        char = pattern[index]
+        index += 1
+        if char == "*":
+            if pattern[index : index + 1] == "*":
+                index += 1
+                out.append(".*")
+            else:
+                out.append("[^/]*")
+        elif char == "?":
+            out.append("[^/]")
+        elif char == "[":
+            end = pattern.find("]", index + 1)
+            if end == -1:
+                out.append(re.escape(char))
+                continue
+            chars = pattern[index:end].replace("\\", "\\\\")
+            index = end + 1
+            if chars[0] == "!":
+                chars = "^" + chars[1:]
+            elif chars[0] == "^":
+                chars = "\\" + chars
+            out.append("[" + chars + "]")
+        else:
+            out.append(re.escape(char))
+    return "".join(out)
+
+
+class Excludes(object):
+    """The 'exclude_copy' rules, compiled.
+
+    Each rule is one of
+
+        text        left out if the file name contains it, as always
+        glob        left out if the name matches, or the path relative to
+                    the template directory if the glob has a '/' in it.
+                    A trailing '/' only matches directories.
+        re:regex    left out if the path matches the regular expression
+        !rule       put back in what an earlier rule left out
+
+    and the last rule that matches decides.  Directory paths end with a '/'.
+    Each 're:' rule is compiled on its own, so it keeps its flags and group
+    numbers.  Without '!' rules the others are joined into one regular
+    expression.  A directory that is left out is left out with everything in
+    it.
+
+    """
+
+    def __init__(self, rules=()):
+        self.rules = []
+        for rule in rules:
+            negate = rule[:1] == "!"
+            if negate:
+                rule = rule[1:]
+            if rule[:3] == "re:":
+                self.rules.append((negate, rule[3:], True))
+                continue
+            if not any(char in rule for char in "*?[/"):
+                # Only matches file names, which don't end with '/'
+                regex = "(?:^|/)[^/]*%s[^/]*$" % re.escape(rule)
+            else:
+                end = "/?$"
+                if rule[-1:] == "/":
+                    end = "/$"
+                    rule = rule[:-1]
+                if "/" in rule:
+                    regex = "^" + glob_regex(rule.lstrip("/")) + end
+                else:
+                    regex = "(?:^|/)" + glob_regex(rule) + end
+            self.rules.append((negate, regex, False))
+        self.ordered = any(negate for negate, _, _ in self.rules)
+        if self.ordered:
+            self.compiled = [(negate, re.compile(i)) for negate, i, _ in self.rules]
+        else:
+            self.compiled = [re.compile(i) for _, i, is_re in self.rules if is_re]
+            joined = [i for _, i, is_re in self.rules if not is_re]
+            if joined:
+                self.compiled.append(re.compile("|".join(joined)))
+
+    def excluded(self, rel_path, is_dir=False):
+        """Is rel_path, relative to the template directory, left out?"""
+        if not self.compiled:
+            return False
+        path = rel_path.replace(os.sep, "/")
+        if is_dir:
+            path += "/"
+        if not self.ordered:
+            return any(regex.search(path) for regex in self.compiled)
+        for negate, regex in reversed(self.compiled):
+            if regex.search(path):
+                return not negate
+        return False
+
+
+class TemplateFile(object):
+    def __init__(self, rel_path, path, size, binary, compiled, error=None, stat=None):
+        self.rel_path = rel_path
+        self.path = path
+        self.size = size
+        self.binary = binary
+        # None for binary files and for text files that can't be compiled,
+        # with the reason in 'error'
+        self.compiled = compiled
+        self.error = error
+        # What the output depends on besides the variables: the compiled
+        # template, or the size, modification time and inode of a binary
+        # file, which are enough to tell that it is the same file.
+        self.signature = None
+        if compiled is not None:
+            self.signature = compiled.signature
+        elif binary and stat is not None:
+            self.signature = (stat.st_size, stat.st_mtime_ns, stat.st_ino)
+
+
+class Manifest(object):
+    """The directories and files of a template directory.
+
+    'sources' are the files the compiled templates depend on and 'dirs'
+    the template directories, whose modification times change when files
+    are added or removed.
+
+    """
+
+    def __init__(self, template_path, rel_dirs, files, sources, dirs):
+        self.template_path = template_path
+        self.rel_dirs = rel_dirs
+        self.files = files
+        self.sources = sources
+        self.dirs = dirs
+
+    def usage(self):
+        """Returns the bytes, files and sub-directories of the template."""
+        return (
+            sum(i.size for i in self.files),
+            len(self.files),
+            len(self.rel_dirs),
+        )
+
+
+def build_manifest(
+    template_path, exclude_list, code, keyword, variables, base_path=None
+):
+    """Walks and compiles the template directory.
+
+    'exclude_list' are the Excludes rules of the files and directories to
+    leave out.
+
+    """
+    from binaryornot.check import is_binary
+
+    excludes = Excludes(exclude_list)
+    rel_dirs = []
+    files = []
+    sources = []
+    dirs = []
+    for root, dirnames, filenames in os.walk(template_path):
+        dirs.append(root)
+        rel_root = os.path.relpath(root, template_path)
+        if rel_root == os.curdir:
+            rel_root = ""
+        # Excluded directories aren't walked into.
+        dirnames[:] = [
+            name
+            for name in dirnames
+            if not excludes.excluded(os.path.join(rel_root, name), True)
+        ]
+        for name in dirnames:
+            rel_dirs.append(os.path.join(rel_root, name))
+        for name in filenames:
+            if excludes.excluded(os.path.join(rel_root, name)):
+                continue
+            path = os.path.join(root, name)
+            binary = is_binary(path)
+            compiled = None
+            error = None
+            if not binary:
+                with open(path, "r") as inputf:
+                    lines = inputf.readlines()
+                try:
+                    compiled = compile_lines(
+                        lines,
+                        code,
+                        keyword,
+                        variables,
+                        sources=sources,
+                        base_path=base_path,
+                    )
+                except NotCompilable as exc:
+                    error = str(exc)
+            sources.append(path)
+            stat = os.stat(path)
+            files.append(
+                TemplateFile(
+                    os.path.relpath(path, template_path),
+                    path,
+                    stat.st_size,
+                    binary,
+                    compiled,
+                    error,
+                    stat,
+                )
+            )
+    return Manifest(template_path, rel_dirs, files, sorted(set(sources)), dirs)
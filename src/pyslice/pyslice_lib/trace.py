@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+"""
+Timeline of a pyslice run in the Chrome trace event format.
+
+The file can be opened in chrome://tracing or https://ui.perfetto.dev.  The
+main thread has its own row with the time spent creating each permutation
+directory ('render') and waiting for a free slot ('wait for slot').  Every
+job slot has a row with the model runs started in it ('run'), each
+beginning with the time it took the launcher to start the process
+('launch').  The time each job spent queued before it was admitted is shown
+as an async event in the 'queue' row.
+
+Recording an event is a tuple appended to a list, the file is only written
+at the end of the run.
+"""
+
+from __future__ import absolute_import, print_function
+
+import json
+import os
+import time
+
+MAIN = 0
+
+
+def slot_tid(slot):
+    """Row of job slot 'slot', the main thread is row MAIN."""
+    return slot + 1
+
+
+class Trace(object):
+    def __init__(self):
+        self.origin = time.perf_counter()
+        self.events = []
+
+    def now(self):
+        return time.perf_counter()
+
+    def complete(self, name, tid, start, end, args=None):
+        """Records 'name' running on row 'tid' from start to end.
+
+        Times are time.perf_counter() values.
+
+        """
+        # list.append is atomic, the job threads need no lock.
+        self.events.append(("X", name, tid, start, end, args))
+
+    def queued(self, ident, start, end, args=None):
+        """Records a job waiting in the queue, jobs may overlap."""
+        self.events.append(("queue", ident, None, start, end, args))
+
+    def _to_us(self, when):
+        return round((when - self.origin) * 1e6, 3)
+
+    def to_json(self, slots):
+        pid = os.getpid()
+        events = [
+            {
+                "ph": "M",
+                "name": "process_name",
+                "pid": pid,
+                "tid": MAIN,
+                "args": {"name": "pyslice"},
+            },
+            {
+                "ph": "M",
+                "name": "thread_name",
+                "pid": pid,
+                "tid": MAIN,
+                "args": {"name": "main"},
+            },
+        ]
+        for slot in range(slots):
+            events.append(
+                {
+                    "ph": "M",
+                    "name": "thread_name",
+                    "pid": pid,
+                    "tid": slot_tid(slot),
+                    "args": {"name": "slot %d" % slot},
+                }
+            )
+        for phase, name, tid, start, end, args in self.events:
+            if phase == "queue":
+                # A begin and end pair with the same id is drawn on its own
+                # track, so overlapping waits stay readable.
+                for ph, when in (("b", start), ("e", end)):
+                    event = {
+                        "ph": ph,
+                        "cat": "queue",
+                        "name": "queue wait",
+                        "id": name,
+                        "pid": pid,
+                        "tid": MAIN,
+                        "ts": self._to_us(when),
+                    }
+                    if ph == "b" and args:
+                        event["args"] = args
+                    events.append(event)
+                continue
+            event = {
+                "ph": "X",
+                "cat": "pyslice",
+                "name": name,
+                "pid": pid,
+                "tid": tid,
+                "ts": self._to_us(start),
+                "dur": self._to_us(end) - self._to_us(start),
+            }
+            if args:
+                event["args"] = args
+            events.append(event)
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def write(self, path, slots):
+        with open(path, "w") as fpo:
+            json.dump(self.to_json(slots), fpo, default=repr)
+
+
+class NullTrace(Trace):
+    """Stands in for Trace when no trace file was asked for."""
+
+    def complete(self, name, tid, start, end, args=None):
+        pass
+
+    def queued(self, ident, start, end, args=None):
+        pass
+
+    def write(self, path, slots):
+        pass
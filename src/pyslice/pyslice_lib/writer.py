@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+"""
+Write rendered files behind the rendering.
+
+WriteBehind takes the text of rendered files and writes them from its own
+thread, so that rendering the next file doesn't wait for the filesystem.
+The text waiting to be written is capped at 'max_bytes': write() waits for
+room when it is full.  The writer takes whatever is waiting, up to
+'batch_bytes' of it, in one go, so a run of small files costs one hand
+over instead of one each.
+
+Every file is written to a temporary name next to it, given the
+permissions and times of its template with shutil.copystat once it is
+written, and renamed over the output.  An output file is the old file or
+the whole new one, so an interrupted run never leaves a half written file
+that a resumed run takes for a rendered one.
+"""
+
+from __future__ import absolute_import, print_function
+
+import collections
+import locale
+import os
+import shutil
+import threading
+
+# Files are written under this suffix and renamed when they are complete.
+TMP_SUFFIX = ".pyslice-tmp"
+
+# What open(path, "w") encodes text with.
+ENCODING = locale.getpreferredencoding(False)
+
+
+def encoded_size(text):
+    """The number of bytes text takes in a file opened with open(path, "w")."""
+    if text.isascii():
+        size = len(text)
+    else:
+        size = len(text.encode(ENCODING))
+    if os.linesep != "\n":
+        size += text.count("\n") * (len(os.linesep) - 1)
+    return size
+
+
+def write_file(path, text, stat_path):
+    """Writes text to path through a temporary file, returns the bytes written.
+
+    The file gets the permissions and times of stat_path.
+
+    """
+    tmp = path + TMP_SUFFIX
+    try:
+        with open(tmp, "w") as output:
+            output.write(text)
+        shutil.copystat(stat_path, tmp)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+    return encoded_size(text)
+
+
+class WriteBehind(object):
+    def __init__(self, max_bytes=16 * 1048576, batch_bytes=1048576):
+        self.max_bytes = max_bytes
+        self.batch_bytes = batch_bytes
+        self.cond = threading.Condition()
+        # (path, text, stat_path) waiting to be written
+        self.queue = collections.deque()
+        # Characters, and files, queued or being written
+        self.buffered = 0
+        self.pending = 0
+        self.error = None
+        self.closed = False
+        self.thread = None
+
+    def write(self, path, text, stat_path):
+        """Queues text to be written to path, waiting if the buffer is full."""
+        with self.cond:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name="pyslice-writer")
+                self.thread.daemon = True
+                self.thread.start()
+            # A file bigger than the buffer goes once the buffer is empty.
+            while self.buffered and self.buffered + len(text) > self.max_bytes:
+                self.cond.wait()
+            self.queue.append((path, text, stat_path))
+            self.buffered += len(text)
+            self.pending += 1
+            self.cond.notify_all()
+
+    def run(self):
+        while True:
+            with self.cond:
+                while not self.queue and not self.closed:
+                    self.cond.wait()
+                if not self.queue:
+                    return
+                batch = []
+                size = 0
+                while self.queue and (not batch or size < self.batch_bytes):
+                    item = self.queue.popleft()
+                    batch.append(item)
+                    size += len(item[1])
+            for path, text, stat_path in batch:
+                try:
+                    write_file(path, text, stat_path)
+                except Exception as exc:
+                    with self.cond:
+                        if self.error is None:
+                            self.error = exc
+            with self.cond:
+                self.buffered -= size
+                self.pending -= len(batch)
+                self.cond.notify_all()
+
+    def flush(self):
+        """Waits until everything queued is written.
+
+        Raises the first error writing a file since the last flush.
+
+        """
+        with self.cond:
+            while self.pending:
+                self.cond.wait()
+            error, self.error = self.error, None
+        if error is not None:
+            raise error
+
+    def close(self):
+        """Writes what is queued and stops the writer thread."""
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        self.closed = False
+        self.flush()
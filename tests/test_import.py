@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+"""
+What 'import pyslice' imports.
+
+The command line starts with the import, so the modules that only some
+sweeps need are left until they are used.  Each check runs in a new
+interpreter, where nothing has been imported yet.
+"""
+
+import os
+import subprocess
+import sys
+
+import pyslice
+
+SRC = os.path.dirname(os.path.dirname(os.path.abspath(pyslice.__file__)))
+
+NOT_IMPORTED = [
+    "numpy",
+    "binaryornot",
+    "concurrent.futures",
+    "pyslice.pyslice_lib.PySPG.ParamParser",
+    "pyslice.pyslice_lib.PySPG.ParamIterators",
+    "pyslice.pyslice_lib.PySPG.Load",
+    "pyslice.pyslice_lib.PySPG.PyGrace",
+    "pyslice.pyslice_lib.PySPG.Agrizer",
+    "pyslice.pyslice_lib.PySPG.histogram",
+]
+
+
+def imported(code):
+    """The modules in sys.modules after running code in a new interpreter."""
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(
+        [SRC] + [i for i in env.get("PYTHONPATH", "").split(os.pathsep) if i]
+    )
+    out = subprocess.check_output(
+        [sys.executable, "-c", code + "\nimport sys\nprint('\\n'.join(sys.modules))"],
+        env=env,
+        universal_newlines=True,
+    )
+    return set(out.split())
+
+
+def test_not_imported():
+    modules = imported("import pyslice")
+    assert [i for i in NOT_IMPORTED if i in modules] == []
+
+
+def test_pyspg_names_without_loading():
+    # dir() and a submodule-only name don't load the other modules.
+    modules = imported(
+        "from pyslice.pyslice_lib import PySPG\n"
+        "assert 'ParamParser' in dir(PySPG) and 'histogram' in dir(PySPG)\n"
+        "PySPG.ParamIterators"
+    )
+    assert "pyslice.pyslice_lib.PySPG.ParamIterators" in modules
+    assert "pyslice.pyslice_lib.PySPG.ParamParser" not in modules
+    assert "numpy" not in modules
@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+"""
+The compiled templates against the old line by line renderer.
+
+tests/golden holds the output trees the line by line renderer of pyslice
+1.6.5 wrote for example/, without its random montecarlo variable, and for
+the sweeps in tests/fixtures:
+
+    keywords  keyword lines: several and repeated expressions, math,
+              formatting, no trailing newline, CRLF, a sub-directory
+    active    active comments with and without '|N' blocks, masks,
+              template strings looked up with '~', a keyword line after
+              a block
+    markers   other keyword, comment and active comment markers
+
+Every permutation is rendered with the Plan and compared byte for byte.
+"""
+
+import configparser
+import filecmp
+import os
+
+import pytest
+
+import pyslice
+from pyslice.pyslice_lib import template
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+CASES = {
+    "example": os.path.join(os.path.dirname(HERE), "example"),
+    "keywords": os.path.join(HERE, "fixtures", "keywords"),
+    "active": os.path.join(HERE, "fixtures", "active"),
+    "markers": os.path.join(HERE, "fixtures", "markers"),
+}
+
+# Writing behind the rendering, and from a pool of render threads.
+FLAGS = [{}, {"write_buffer": "0", "render_threads": "4"}]
+
+
+def tree(path):
+    """The relative paths of the files under path."""
+    return sorted(
+        os.path.relpath(os.path.join(root, name), path)
+        for root, _, names in os.walk(path)
+        for name in names
+    )
+
+
+def render_all(case_path, output_path, flags):
+    configuration = configparser.ConfigParser()
+    configuration.read(os.path.join(case_path, "pyslice.ini"))
+    # Random samples can't be compared.
+    configuration.remove_section("mc")
+    configuration.set("paths", "output_path", str(output_path))
+    for name, value in flags.items():
+        configuration.set("flags", name, value)
+    plan = pyslice.Plan(configuration, base_path=case_path)
+    try:
+        for perm_id, _ in plan.iter_permutations():
+            plan.render(perm_id)
+    finally:
+        plan.close()
+
+
+@pytest.mark.parametrize("flags", FLAGS, ids=["write_behind", "threads"])
+@pytest.mark.parametrize("case", sorted(CASES))
+def test_golden(case, flags, tmp_path):
+    golden = os.path.join(HERE, "golden", case)
+    output = tmp_path / "output"
+    render_all(CASES[case], output, flags)
+    assert tree(output) == tree(golden)
+    for rel_path in tree(golden):
+        assert filecmp.cmp(
+            os.path.join(golden, rel_path), str(output / rel_path), shallow=False
+        ), rel_path
+
+
+@pytest.mark.parametrize(
+    "lines",
+    [
+        # Block length that isn't a number
+        ["#$ {flow}|x\n", "1\n"],
+        # Block running past the end of the file
+        ["#$ {flow}|3\n", "1\n", "2\n"],
+        # Record that isn't in the template strings file
+        ["#$ ~9 strings.txt |1\n", "1\n"],
+        # Template strings file that isn't there
+        ["#$ ~1 missing.txt |1\n", "1\n"],
+        # Malformed format field
+        ["#$ {flow|1\n", "1\n"],
+    ],
+    ids=["blocklen", "past_end", "record", "strings_file", "field"],
+)
+def test_not_compilable(lines, tmp_path):
+    # The line by line renderer stopped with an error on each of these.
+    (tmp_path / "strings.txt").write_text("1|{flow}\n")
+    with pytest.raises(template.NotCompilable):
+        template.compile_lines(lines, "#$", "$$", ["flow"], base_path=str(tmp_path))
+
+
+def test_not_compilable_on_render(tmp_path):
+    case = tmp_path / "case"
+    (case / "input_template").mkdir(parents=True)
+    with open(os.path.join(CASES["active"], "pyslice.ini")) as fpi:
+        (case / "pyslice.ini").write_text(fpi.read())
+    (case / "input_template" / "good.txt").write_text("$$flow$$\n")
+    (case / "input_template" / "bad.txt").write_text("#$ {flow}|2\n1\n")
+    plan = pyslice.Plan.from_ini(str(case / "pyslice.ini"))
+    try:
+        with pytest.raises(template.NotCompilable, match="past the end"):
+            plan.render(0)
+    finally:
+        plan.close()
+
+
+@pytest.mark.parametrize("flags", FLAGS, ids=["write_behind", "threads"])
+def test_bytes_written(flags, tmp_path):
+    # render() counts the bytes in the files, not the characters.
+    (tmp_path / "input_template").mkdir()
+    with open(str(tmp_path / "input_template" / "u.txt"), "w") as fpo:
+        fpo.write("héllo $$flow$$ €\n")
+    (tmp_path / "input_template" / "p.txt").write_text("plain $$flow$$\n")
+    config = {
+        "paths": {"template_path": "input_template", "output_path": "output"},
+        "flags": dict({"keyword": "$$", "flat_dirs": "yes"}, **flags),
+        "program": {"program": "true"},
+        "flow": {"type": "list", "values_list": [7, 1000]},
+    }
+    plan = pyslice.Plan.from_dict(config, base_path=str(tmp_path))
+    try:
+        for perm_id, _ in plan.iter_permutations():
+            written = plan.render(perm_id)
+            directory = tmp_path / "output" / plan.directory(perm_id)
+            assert written == sum(i.stat().st_size for i in directory.iterdir())
+    finally:
+        plan.close()